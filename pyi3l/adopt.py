@@ -0,0 +1,58 @@
+import re
+from typing import List
+
+from pyi3l.tree import Window, optimize_swallows
+from pyi3l.ipc import Connection, iter_cons, quote, report_failures
+from pyi3l.placeholders import MARK_PREFIX, generated_mark, criteria
+
+# Adopting already running windows into fresh placeholders, instead of launching the apps again.
+#
+# For each placeholder (recognized by its generated mark), we look for an existing window matching its
+# swallows, swap the window with the placeholder and close the placeholder. Marks of the Window are moved to
+# the adopted window. All of this is sent to i3 as a single batch of commands.
+
+def swallow_matches(swallow: dict, properties: dict):
+    return all(
+        re.search(pattern, properties.get(key) or "") is not None
+        for key, pattern in swallow.items()
+    )
+
+def adoption_commands(tree, windows: List[Window]):
+    # Returns (commands, adopted marks)
+    existing = [con for con in iter_cons(tree) if con.get("window") is not None]
+    used = set()
+    commands = []
+    adopted = set()
+    for window in windows:
+        mark = generated_mark(window)
+        if mark is None:
+            continue
+        swallows = list(map(lambda sw: sw.to_json(), optimize_swallows(window.content.swallows)))
+        con = next(
+            (
+                con
+                for con in existing
+                if con["id"] not in used and any(
+                    swallow_matches(swallow, con.get("window_properties") or {})
+                    for swallow in swallows
+                )
+            ),
+            None
+        )
+        if con is None:
+            continue
+        used.add(con["id"])
+        adopted.add(mark)
+        commands.append(f"[con_id={con['id']}] swap container with mark {mark}")
+        commands.append(f"{criteria(mark)} kill")
+        for user_mark in window.marks or []:
+            if not user_mark.startswith(MARK_PREFIX):
+                commands.append(f"[con_id={con['id']}] mark --add {quote(user_mark)}")
+    return commands, adopted
+
+def adopt(connection: Connection, windows: List[Window]):
+    # Moves existing windows into placeholders of the given windows, returns marks of the adopted ones
+    commands, adopted = adoption_commands(connection.get_tree(), windows)
+    if commands:
+        report_failures(connection.command(";".join(commands)))
+    return adopted
@@ -15,18 +15,24 @@ def bashify_layout(ws, layout: Toplevel, workspace_switching: bool = True):
     ])
 
 
-def bashify(d, commands: bool = True, layout: bool = True, workspace_switching: bool = True):
+def bashify(d, commands: bool = True, layout: bool = True, workspace_switching: bool = True, coalesce: bool = False):
     
     cmds = [
         cmd
         for layout in d.values()
         for cmd in layout.to_commands()
     ]
+    if coalesce:
+        cmds = [cmd for _, cmd in coalesce_launches([(None, cmd) for cmd in cmds])]
 
     return "#!/usr/bin/bash\n\n" + "\n".join([
         *([
             "# Set up workspaces",
-            *map(lambda x: bashify_layout(x[0], x[1], workspace_switching=workspace_switching), d.items()),
+            *[
+                bashify_layout(ws, placeholders, workspace_switching=workspace_switching)
+                for ws, placeholders in map(lambda x: (x[0], x[1].without_rules()), d.items())
+                if placeholders is not None
+            ],
         ] if layout else []),
         "",
         "",
@@ -0,0 +1,104 @@
+import argparse
+import os
+import sys
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from pyi3l.util import write_if_changed
+
+# Compiles many layout scripts to Bash (like --export-bash-script) in a process pool:
+#
+#     python -m pyi3l.batch -o out/ layouts/*.py
+#
+# Each worker is a long-lived interpreter, so importing pyi3l is paid once per worker, not once per script.
+# Outputs are written only when their content changes, errors are reported per script.
+#
+# With -o, the directory structure below the common directory of the scripts is mirrored, and script.py:VAR
+# is written to script-VAR.sh, so that different inputs never share an output.
+
+def _init_worker():
+    import pyi3l    # warm up the worker
+
+def run_in_pool(function, args_list, jobs: int = None):
+    # Calls function(*args) for each args in a process pool, yields the results in the same order
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker) as pool:
+        futures = [pool.submit(function, *args) for args in args_list]
+        for future in futures:
+            yield future.result()
+
+def report(results, out = sys.stdout):
+    # Prints (input, status, detail) results and a summary, returns the exit status
+    counts = Counter()
+    for name, status, detail in results:
+        print(f"{status:9} {name}: {detail}", file=out)
+        counts[status] += 1
+    print(", ".join(f"{n} {status}" for status, n in sorted(counts.items())) or "nothing to do", file=out)
+    return 1 if counts["error"] else 0
+
+def output_paths(specs, output_dir: str = None, extension: str = ".sh"):
+    # Returns {spec: output path}, raises ValueError when two inputs would be written to the same file
+    paths = {spec: os.path.abspath(spec.partition(":")[0]) for spec in specs}
+    if output_dir is not None and paths:
+        base = os.path.commonpath([os.path.dirname(path) for path in paths.values()])
+    outputs = {}
+    for spec, path in paths.items():
+        name = spec.partition(":")[2]
+        stem = os.path.splitext(os.path.basename(path))[0] + (f"-{name}" if name else "")
+        if output_dir is None:
+            directory = os.path.dirname(path)
+        else:
+            directory = os.path.normpath(os.path.join(output_dir, os.path.relpath(os.path.dirname(path), base)))
+        outputs[spec] = os.path.join(directory, stem + extension)
+    inputs = {}
+    for spec, out in outputs.items():
+        inputs.setdefault(out, []).append(spec)
+    collisions = [f"{out} ({', '.join(specs)})" for out, specs in inputs.items() if len(specs) > 1]
+    if collisions:
+        raise ValueError("Several inputs would be written to the same file: " + "; ".join(collisions))
+    return outputs
+
+def compile_script(spec: str, out: str, exact_keys: bool = False, **options):
+    # Returns (spec, status, detail) where status is "written", "unchanged" or "error"
+    from pyi3l.cmd import load_layouts, transform_layouts
+    from pyi3l.bashify import bashify
+    try:
+        os.makedirs(os.path.dirname(out), exist_ok=True)
+        d = transform_layouts(load_layouts(spec), exact_keys=exact_keys)
+        written = write_if_changed(out, bashify(d, **options) + "\n", mode=0o755)
+        return spec, "written" if written else "unchanged", out
+    except BaseException as e:
+        return spec, "error", f"{type(e).__name__}: {e}"
+
+def compile_all(specs, output_dir: str = None, jobs: int = None, **options):
+    outputs = output_paths(specs, output_dir)
+    return run_in_pool(partial(compile_script, **options), outputs.items(), jobs)
+
+def main():
+    parser = argparse.ArgumentParser(description="Export many layout scripts to Bash in parallel")
+    parser.add_argument("scripts", nargs="+", metavar="SCRIPT[:VARIABLE]")
+    parser.add_argument("-o", "--output-dir", help="defaults to the directory of each script")
+    parser.add_argument("-j", "--jobs", type=int)
+    parser.add_argument("--skip-commands", action="store_true")
+    parser.add_argument("--skip-layout", action="store_true")
+    parser.add_argument("--skip-workspace-switching", action="store_true")
+    parser.add_argument("--coalesce-launches", action="store_true")
+    parser.add_argument("--exact-keys", action="store_true")
+    args = parser.parse_args()
+    try:
+        results = compile_all(
+            args.scripts,
+            output_dir=args.output_dir,
+            jobs=args.jobs,
+            commands=not args.skip_commands,
+            layout=not args.skip_layout,
+            workspace_switching=not args.skip_workspace_switching,
+            coalesce=args.coalesce_launches,
+            exact_keys=args.exact_keys,
+        )
+    except ValueError as e:
+        parser.error(str(e))
+    sys.exit(report(results))
+
+if __name__ == "__main__":
+    main()
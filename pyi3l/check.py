@@ -0,0 +1,99 @@
+from dataclasses import dataclass
+from typing import List
+
+from pyi3l.tree import Window, Swallow, optimize_swallows
+from pyi3l.placeholders import windows_of
+
+# Detection of placeholders that can swallow the same window. i3 gives such a window to whichever placeholder
+# it finds first, so it may end up in a wrong place.
+#
+# Pairs of swallows are checked for a common match by intersecting their pattern automata. To avoid checking
+# all pairs, swallows are indexed by the literal prefix of their class: patterns whose prefixes aren't
+# prefixes of each other can't overlap. The same quick prefix test on the other attributes filters the
+# remaining candidates, so automata are built only for pairs that are likely to overlap.
+
+ATTRIBUTES = ["win_class", "instance", "machine", "title", "window_role"]
+
+@dataclass
+class Entry:
+    ws: object
+    window: Window
+    window_index: int
+    swallow: Swallow
+
+    def __post_init__(self):
+        self.prefixes = [
+            None if getattr(self.swallow, attribute) is None else getattr(self.swallow, attribute).literal_prefix()
+            for attribute in ATTRIBUTES
+        ]
+
+    def may_intersect(self, other: "Entry"):
+        # Quick check of literal prefixes of all attributes, before we build any automata
+        return all(
+            a is None or b is None or a.startswith(b) or b.startswith(a)
+            for a, b in zip(self.prefixes, other.prefixes)
+        )
+
+    def describe(self):
+        return f"workspace {self.ws}: {self.window.name or self.window.content.default_name or '(unnamed window)'}"
+
+def swallows_intersect(a: Swallow, b: Swallow, cache: dict):
+    # cache maps pairs of regexes to results, layouts tend to repeat the same patterns a lot
+    for attribute in ATTRIBUTES:
+        pa, pb = getattr(a, attribute), getattr(b, attribute)
+        if pa is None or pb is None:
+            continue
+        key = (pa.to_pcre(), pb.to_pcre())
+        if key not in cache:
+            cache[key] = pa.intersects(pb)
+        if not cache[key]:
+            return False
+    return True
+
+def class_prefix(swallow: Swallow):
+    return "" if swallow.win_class is None else swallow.win_class.literal_prefix()
+
+def candidate_pairs(entries: List[Entry]):
+    index = {}
+    for i, entry in enumerate(entries):
+        index.setdefault(class_prefix(entry.swallow), []).append(i)
+    for i, entry in enumerate(entries):
+        prefix = class_prefix(entry.swallow)
+        for k in range(len(prefix) + 1):
+            for j in index.get(prefix[:k], []):
+                # pairs with equal prefixes are visited from both sides, take just one of them
+                other = entries[j]
+                if (k < len(prefix) or j < i) and other.window_index != entry.window_index and \
+                        other.may_intersect(entry):
+                    yield other, entry
+
+def find_overlaps(d):
+    # Returns pairs of entries (swallows of different windows) that can match the same window
+    entries = [
+        Entry(ws, window, window_index, swallow)
+        for window_index, (ws, window) in enumerate(
+            (ws, window)
+            for ws, toplevel in d.items()
+            if toplevel.without_rules() is not None
+            for window in windows_of(toplevel.without_rules())
+        )
+        for swallow in optimize_swallows(window.content.swallows)
+    ]
+    cache = {}
+    reported = set()
+    overlaps = []
+    for a, b in candidate_pairs(entries):
+        windows = frozenset([a.window_index, b.window_index])
+        if windows not in reported and swallows_intersect(a.swallow, b.swallow, cache):
+            reported.add(windows)
+            overlaps.append((a, b))
+    return overlaps
+
+def check(d):
+    # Prints the report, returns True when there are no overlaps
+    overlaps = find_overlaps(d)
+    for a, b in overlaps:
+        print(f"Ambiguous swallows: {a.describe()} {a.swallow.to_json()} and {b.describe()} {b.swallow.to_json()}")
+    if not overlaps:
+        print("No overlapping swallows")
+    return not overlaps
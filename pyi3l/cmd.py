@@ -1,25 +1,160 @@
 from pyi3l.exec import *
 from pyi3l.bashify import bashify
+from pyi3l.rules import rules
 import argparse
+from functools import partial
+import logging
+import os
+import runpy
+import sys
+
+class LayoutCollected(Exception):
+    def __init__(self, d):
+        super().__init__("apply() called while collecting layouts")
+        self.d = d
+
+_collecting = False
+
+def load_layouts(spec: str):
+    # Runs a layout script and returns the dict it passes to apply(), without applying anything.
+    # With "script.py:NAME", the script is run as a module and its variable NAME is returned instead.
+    global _collecting
+    path, _, name = spec.partition(":")
+    _collecting = True
+    try:
+        variables = runpy.run_path(path, run_name="__main__" if name == "" else "pyi3l_layout")
+    except LayoutCollected as e:
+        return e.d
+    finally:
+        _collecting = False
+    if name != "":
+        return variables[name]
+    raise ValueError(f"{path} did not call apply()")
+
+def transform_layouts(d, exact_keys: bool = False):
+    # Rewrites of the layout dict selected on the command line. apply, watch and batch share it, so that
+    # a reloaded or exported script gets exactly what apply gives it. The result is deterministic.
+    if exact_keys:
+        mapper = ExactKeys()    # a fresh one, so that the same script gets the same keys
+        d = {ws: toplevel.map_windows(mapper) for ws, toplevel in d.items()}
+    return d
+
+def load_history(path):
+    from pyi3l.history import History   # imported lazily, so that `python -m pyi3l.history` works cleanly
+    return History(path)
+
+def load_prefetch(args):
+    if not args.prefetch and not args.prefetch_path:
+        return None
+    from pyi3l.prefetch import Prefetcher
+    return Prefetcher(args.prefetch_path)
+
+def load_throttle(args):
+    thresholds = {
+        resource: getattr(args, f"max_{resource}_pressure")
+        for resource in ["memory", "io", "cpu"]
+        if getattr(args, f"max_{resource}_pressure") is not None
+    }
+    if not thresholds:
+        return None
+    from pyi3l.pressure import Throttle
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    return Throttle(thresholds)
 
 def apply(d):
+    if _collecting:
+        raise LayoutCollected(d)
     parser = argparse.ArgumentParser()
     parser.add_argument("--export-bash-script", action="store_true")
+    parser.add_argument(
+        "--export-i3-rules", action="store_true",
+        help="print i3 config rules (assign/for_window) for windows with placement=\"rule\"",
+    )
+    parser.add_argument("--all-windows-as-rules", action="store_true", help="with --export-i3-rules, export all windows")
+    parser.add_argument("--check", action="store_true", help="report placeholders that can swallow the same window")
     parser.add_argument("--skip-commands", action="store_true")
     parser.add_argument("--skip-layout", action="store_true")
     parser.add_argument("--skip-workspace-switching", action="store_true")
+    parser.add_argument(
+        "--placeholder-timeout", type=float, metavar="SECONDS",
+        help="report placeholders not filled in time (WindowContent.timeout takes precedence)",
+    )
+    parser.add_argument("--remove-stale-placeholders", action="store_true")
+    parser.add_argument(
+        "--adopt", action="store_true",
+        help="move already running windows into the placeholders and launch only commands for unfilled ones",
+    )
+    parser.add_argument(
+        "--history", nargs="?", const="", metavar="DB",
+        help="launch apps in order of their measured startup time (slowest first) and record new measurements",
+    )
+    for resource in ["memory", "io", "cpu"]:
+        parser.add_argument(
+            f"--max-{resource}-pressure", type=float, metavar="PERCENT",
+            help=f"hold back launches while {resource} pressure (PSI) is higher",
+        )
+    parser.add_argument(
+        "--exact-keys", action="store_true",
+        help="label windows of supporting apps (e.g. xfce4-terminal --role) and swallow them by the exact label",
+    )
+    parser.add_argument(
+        "--coalesce-launches", action="store_true",
+        help="start apps able to open multiple windows (e.g. xfce4-terminal) just once for all their windows",
+    )
+    parser.add_argument(
+        "--prefetch", action="store_true",
+        help="read executables and shared libraries of the commands into the page cache in parallel",
+    )
+    parser.add_argument(
+        "--prefetch-path", action="append", default=[], metavar="PATH",
+        help="also prefetch this file or directory (e.g. an IDE install dir), implies --prefetch",
+    )
+    parser.add_argument(
+        "--watch", action="store_true",
+        help="after applying, re-apply changed workspaces and launch new commands whenever this script is saved",
+    )
     args = parser.parse_args()
-    if args.export_bash_script:
+    transform = partial(transform_layouts, exact_keys=args.exact_keys)
+    d = transform(d)
+    if args.check:
+        from pyi3l.check import check
+        sys.exit(0 if check(d) else 1)
+    elif args.export_i3_rules:
+        print(rules(d, all_windows=args.all_windows_as_rules))
+    elif args.export_bash_script:
         print(bashify(
             d,
             commands=not args.skip_commands,
             layout=not args.skip_layout,
             workspace_switching=not args.skip_workspace_switching,
+            coalesce=args.coalesce_launches,
         ))
     else:
+        if args.watch:
+            # watch recognizes the placeholders of this run by their generated marks
+            from pyi3l.placeholders import mark_windows
+            d = mark_windows(d)
         run(
             d,
             commands=not args.skip_commands,
             layout=not args.skip_layout,
             workspace_switching=not args.skip_workspace_switching,
+            placeholder_timeout=args.placeholder_timeout,
+            remove_stale=args.remove_stale_placeholders,
+            history=None if args.history is None else load_history(args.history or None),
+            adopt=args.adopt,
+            throttle=load_throttle(args),
+            coalesce=args.coalesce_launches,
+            prefetch=load_prefetch(args),
+            keep_marks=args.watch,
         )
+        if args.watch:
+            from pyi3l.watch import watch
+            watch(
+                os.path.abspath(sys.argv[0]),
+                d,
+                transform=transform,
+                commands=not args.skip_commands,
+                layout=not args.skip_layout,
+                workspace_switching=not args.skip_workspace_switching,
+            )
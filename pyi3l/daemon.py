@@ -0,0 +1,205 @@
+import argparse
+import asyncio
+import sys
+import tempfile
+import time
+from typing import Optional
+
+from pyi3l.tree import coalesce_launches
+from pyi3l.ipc import AsyncConnection, report_failures
+from pyi3l.exec import layout_command
+from pyi3l.placeholders import PlaceholderTracker, mark_windows, kill_command, unmark_command
+
+# A single process serving several i3 instances, e.g. one per X display on a shared workstation:
+#
+#     python -m pyi3l.daemon \
+#         --session /run/user/1000/i3/ipc-socket.123 :0 work.py \
+#         --session /run/user/1001/i3/ipc-socket.456 :1 layouts.py:LAYOUTS
+#
+# Each session is a coroutine with its own IPC connections, layouts, window event subscription and launch
+# queue. Commands are spawned with DISPLAY and I3SOCK of their session, so apps open on the right display.
+# A session ends when its i3 exits or restarts, other sessions keep running.
+
+class Session:
+    def __init__(
+        self,
+        socket_path: str,
+        layouts,
+        display: Optional[str] = None,
+        launch = None,
+        commands: bool = True,
+        workspace_switching: bool = True,
+        coalesce: bool = False,
+        placeholder_timeout: Optional[float] = None,
+        remove_stale: bool = False,
+        throttle = None,
+        out = sys.stderr,
+    ):
+        # launch(windows, cmd) defaults to spawning the command with the session's environment, it can be
+        # replaced, e.g. by I3Simulator.fake_launch
+        self.socket_path = socket_path
+        self.layouts = layouts
+        self.display = display
+        self.launch = launch if launch is not None else self.spawn
+        self.commands = commands
+        self.workspace_switching = workspace_switching
+        self.coalesce = coalesce
+        self.remove_stale = remove_stale
+        self.throttle = throttle
+        self.out = out
+        self.tracker = PlaceholderTracker(
+            None, default_timeout=placeholder_timeout, remove_stale=remove_stale, out=out
+        )
+        self.launches = asyncio.Queue()
+
+    def name(self):
+        return self.display or self.socket_path
+
+    def log(self, message: str):
+        print(f"[{self.name()}] {message}", file=self.out)
+
+    def env(self):
+        env = {"I3SOCK": self.socket_path}
+        if self.display is not None:
+            env["DISPLAY"] = self.display
+        return env
+
+    def spawn(self, windows, cmd):
+        cmd.to_invocation().spawn(extra_env=self.env())
+
+    async def apply(self, connection: AsyncConnection, d):
+        for ws, toplevel in d.items():
+            placeholders = toplevel.without_rules()
+            if placeholders is None:
+                continue
+            with tempfile.NamedTemporaryFile() as tmp:
+                tmp.write(placeholders.to_layout_string().encode("utf-8"))
+                tmp.flush()
+                report_failures(await connection.command(layout_command(ws, tmp.name, self.workspace_switching)))
+            self.tracker.track(ws, placeholders)
+
+    async def launcher(self):
+        while True:
+            windows, cmd = await self.launches.get()
+            try:
+                if self.throttle is not None:
+                    await asyncio.to_thread(self.throttle.wait, cmd.to_shell_command())
+                self.launch(windows, cmd)
+                for window in windows:
+                    self.tracker.launched(window)
+            except Exception as e:
+                # a failing command mustn't stop the rest of the queue
+                self.log(f"cannot launch {cmd.to_shell_command()}: {type(e).__name__}: {e}")
+            finally:
+                self.launches.task_done()
+
+    async def handle_events(self, connection: AsyncConnection, events: AsyncConnection, forever: bool):
+        unmarked = 0
+        while True:
+            deadline = self.tracker.next_deadline()
+            if deadline is None and not forever:
+                # we stop watching, placeholders without a timeout don't need their generated marks anymore
+                if self.tracker.pending:
+                    report_failures(await connection.command(unmark_command(list(self.tracker.pending))))
+                return
+            try:
+                message = await events.read_event(None if deadline is None else deadline - time.monotonic())
+            except ConnectionError:
+                self.log("i3 closed the IPC connection, ending session")
+                return
+            if message is not None:
+                event, payload = message
+                if event == "shutdown":
+                    self.log(f"i3 {payload.get('change')}, ending session")
+                    return
+                self.tracker.handle(event, payload)
+            expired = self.tracker.expire(time.monotonic())
+            if expired and self.remove_stale:
+                report_failures(await connection.command(kill_command(expired)))
+            # generated marks of filled placeholders, and of stale ones we keep, aren't needed anymore
+            settled = self.tracker.filled[unmarked:] + ([] if self.remove_stale else expired)
+            unmarked = len(self.tracker.filled)
+            if settled:
+                report_failures(await connection.command(unmark_command([p.mark for p in settled])))
+
+    async def serve(self, forever: bool = True):
+        # Applies the layouts, launches their commands and follows window events of this i3 instance.
+        # With forever=False, returns once every placeholder with a timeout is either filled or stale.
+        connection = await AsyncConnection.open(self.socket_path)
+        events = await AsyncConnection.open(self.socket_path)
+        launcher = None
+        try:
+            await events.subscribe(["window", "shutdown"])
+            d = mark_windows(self.layouts)
+            await self.apply(connection, d)
+            if self.commands:
+                launches = [item for toplevel in d.values() for item in toplevel.to_launches()]
+                if self.coalesce:
+                    grouped = coalesce_launches(launches)
+                else:
+                    grouped = [([window], cmd) for window, cmd in launches]
+                for item in grouped:
+                    self.launches.put_nowait(item)
+            launcher = asyncio.create_task(self.launcher())
+            if not forever:
+                await self.launches.join()
+            await self.handle_events(connection, events, forever)
+            self.log(f"{len(self.tracker.filled)} placeholders filled, {len(self.tracker.stale)} stale")
+        finally:
+            if launcher is not None:
+                launcher.cancel()
+            await connection.close()
+            await events.close()
+        return self.tracker
+
+async def serve(sessions, forever: bool = True):
+    # Runs all sessions concurrently, a failing session doesn't stop the others
+    results = await asyncio.gather(*(session.serve(forever) for session in sessions), return_exceptions=True)
+    for session, result in zip(sessions, results):
+        if isinstance(result, BaseException):
+            session.log(f"failed: {type(result).__name__}: {result}")
+    return results
+
+def main():
+    from pyi3l.cmd import load_layouts, load_throttle
+    parser = argparse.ArgumentParser(description="Apply layouts to several i3 instances from one process")
+    parser.add_argument(
+        "--session",
+        nargs=3,
+        action="append",
+        required=True,
+        metavar=("I3SOCK", "DISPLAY", "SCRIPT[:VARIABLE]"),
+        help="use an empty DISPLAY to keep the inherited one",
+    )
+    parser.add_argument("--skip-commands", action="store_true")
+    parser.add_argument("--skip-workspace-switching", action="store_true")
+    parser.add_argument("--coalesce-launches", action="store_true")
+    parser.add_argument("--placeholder-timeout", type=float, metavar="SECONDS")
+    parser.add_argument("--remove-stale-placeholders", action="store_true")
+    parser.add_argument("--max-memory-pressure", type=float, metavar="PERCENT")
+    parser.add_argument("--max-io-pressure", type=float, metavar="PERCENT")
+    parser.add_argument("--max-cpu-pressure", type=float, metavar="PERCENT")
+    args = parser.parse_args()
+    throttle = load_throttle(args)
+    sessions = [
+        Session(
+            socket_path,
+            load_layouts(spec),
+            display=display or None,
+            commands=not args.skip_commands,
+            workspace_switching=not args.skip_workspace_switching,
+            coalesce=args.coalesce_launches,
+            placeholder_timeout=args.placeholder_timeout,
+            remove_stale=args.remove_stale_placeholders,
+            throttle=throttle,
+        )
+        for socket_path, display, spec in args.session
+    ]
+    try:
+        results = asyncio.run(serve(sessions))
+    except KeyboardInterrupt:
+        return
+    sys.exit(1 if any(isinstance(result, BaseException) for result in results) else 0)
+
+if __name__ == "__main__":
+    main()
@@ -1,29 +1,132 @@
-import subprocess
+import sys
 import tempfile
+from contextlib import ExitStack
 from pyi3l.tree import *
+from pyi3l.ipc import Connection, report_failures
+from pyi3l.placeholders import PlaceholderTracker, mark_windows, windows_of, generated_mark, unmark_command
+from pyi3l.adopt import adopt as adopt_windows
 
-def use_layout(ws, layout: Toplevel, workspace_switching: bool = True):
+# how long we wait for windows just to record their durations to history, when no placeholder timeout is set
+HISTORY_TIMEOUT = 60.0
+
+def use_layout(ws, layout: Toplevel, workspace_switching: bool = True, connection: Optional[Connection] = None):
+    if connection is None:
+        with Connection() as conn:
+            return use_layout(ws, layout, workspace_switching=workspace_switching, connection=conn)
     with tempfile.NamedTemporaryFile() as tmp:
         tmp.write(layout.to_layout_string().encode("utf-8"))
         tmp.flush()
-        subprocess.run([    
-            "i3-msg", 
-            ";".join([
-                f"workspace {ws};" if workspace_switching and (ws is not None) else "",
-                "append_layout " + tmp.name
-            ])
-        ])
+        report_failures(connection.command(layout_command(ws, tmp.name, workspace_switching)))
+
+def layout_command(ws, path: str, workspace_switching: bool = True):
+    return "".join([
+        f"workspace {ws};" if workspace_switching and (ws is not None) else "",
+        "append_layout " + path
+    ])
+
+def spawn(windows: List[Optional[Window]], cmd: Command):
+    cmd.to_invocation().spawn()
+
+def try_launch(launch, windows: List[Optional[Window]], cmd: Command, out = sys.stderr):
+    # Like `cmd &` in a script, a command that can't be started (missing executable, bad working directory)
+    # fails just itself. Returns whether it was started.
+    try:
+        launch(windows, cmd)
+        return True
+    except OSError as e:
+        print(f"Cannot launch {cmd.to_shell_command()}: {e}", file=out)
+        return False
 
-def run(d, commands: bool = True, layout: bool = True, workspace_switching: bool = True):
-    if layout:
-        for ws, layout in d.items():
-            use_layout(ws, layout, workspace_switching=workspace_switching)
-    if commands:
-        cmds = [
-            cmd
-            for layout in d.values()
-            for cmd in layout.to_commands()
-        ]
-        for cmd in cmds:
-            subprocess.run(cmd.to_shell_command() + " &", shell = True)
+def record_duration(history, placeholder):
+    if placeholder.launched_at is not None:
+        history.record(placeholder.window.content, placeholder.filled_at - placeholder.launched_at)
 
+def run(
+    d,
+    commands: bool = True,
+    layout: bool = True,
+    workspace_switching: bool = True,
+    socket_path: Optional[str] = None,
+    launch = spawn,
+    placeholder_timeout: Optional[float] = None,
+    remove_stale: bool = False,
+    history = None,
+    adopt: bool = False,
+    throttle = None,
+    coalesce: bool = False,
+    prefetch = None,
+    keep_marks: bool = False,
+):
+    # launch(windows, cmd) starts a single command, which is supposed to open the windows (just one, unless
+    # coalesced); it can be replaced, e.g. by I3Simulator.fake_launch
+    # coalesce merges commands of apps able to open multiple windows from one process (see Command.coalesce)
+    # history (pyi3l.history.History) orders launches slowest first and records new durations
+    # adopt moves already running windows into the new placeholders and launches commands only for the rest
+    # throttle (pyi3l.pressure.Throttle) holds back launches while the system is under pressure
+    # prefetch (pyi3l.prefetch.Prefetcher) reads executables and libraries of the commands in background,
+    # starting before the layout is applied
+    # keep_marks leaves generated marks (see pyi3l.placeholders) on placeholders that are still unfilled, for
+    # callers that need to find them later, like watch
+    if history is not None and placeholder_timeout is None:
+        placeholder_timeout = HISTORY_TIMEOUT
+    tracking = layout and (
+        placeholder_timeout is not None or
+        any(w.content.timeout is not None for toplevel in d.values() for w in windows_of(toplevel))
+    )
+    if tracking or (layout and adopt):
+        d = mark_windows(d)
+    if commands and prefetch is not None:
+        prefetch.start([cmd for toplevel in d.values() for cmd in toplevel.to_commands()])
+    with ExitStack() as stack:
+        if commands and prefetch is not None:
+            stack.callback(prefetch.finish)
+        connection = stack.enter_context(Connection(socket_path)) if layout else None
+        tracker = PlaceholderTracker(
+            stack.enter_context(Connection(socket_path)),
+            default_timeout=placeholder_timeout,
+            remove_stale=remove_stale,
+            on_filled=None if history is None else partial(record_duration, history),
+        ) if tracking else None
+        if layout:
+            for ws, toplevel in d.items():
+                placeholders = toplevel.without_rules()
+                if placeholders is None:
+                    continue
+                use_layout(ws, placeholders, workspace_switching=workspace_switching, connection=connection)
+                if tracker is not None:
+                    tracker.track(ws, placeholders)
+        adopted = set()
+        if layout and adopt:
+            placeholders = [
+                window
+                for toplevel in d.values()
+                if toplevel.without_rules() is not None
+                for window in windows_of(toplevel.without_rules())
+            ]
+            adopted = adopt_windows(connection, placeholders)
+            if tracker is not None:
+                tracker.adopted(adopted)
+            elif not keep_marks:
+                # the generated marks were needed just for adopting, don't pass them on to windows launched later
+                marks = [mark for mark in map(generated_mark, placeholders) if mark is not None and mark not in adopted]
+                if marks:
+                    report_failures(connection.command(unmark_command(marks)))
+        if commands:
+            launches = [
+                item
+                for toplevel in d.values()
+                for item in toplevel.to_launches()
+                if item[0] is None or generated_mark(item[0]) not in adopted
+            ]
+            if history is not None:
+                launches = history.order(launches)
+            grouped = coalesce_launches(launches) if coalesce else [([window], cmd) for window, cmd in launches]
+            for windows, cmd in grouped:
+                if throttle is not None:
+                    throttle.wait(cmd.to_shell_command())
+                started = try_launch(launch, windows, cmd)
+                if tracker is not None and started:
+                    for window in windows:
+                        tracker.launched(window)
+        if tracker is not None:
+            tracker.wait(connection, keep_marks=keep_marks)
@@ -0,0 +1,103 @@
+import argparse
+import json
+import os
+import sqlite3
+import time
+from typing import Optional
+
+from pyi3l.tree import WindowContent
+
+# Measured spawn-to-swallow durations per WindowContent, used for launching the slowest apps first.
+#
+#     python -m pyi3l.history     # shows the history per app
+
+SAMPLES_PER_KEY = 10    # only recent samples matter, apps get faster or slower with updates
+
+def default_path():
+    state_home = os.environ.get("XDG_STATE_HOME") or os.path.expanduser("~/.local/state")
+    return os.path.join(state_home, "pyi3l", "history.sqlite3")
+
+def content_key(content: WindowContent):
+    # Identifies the app by what it looks like to i3, not by how it's started
+    return json.dumps(
+        [content.default_name, list(map(lambda sw: sw.to_json(), content.swallows))],
+        sort_keys=True,
+    )
+
+class History:
+    def __init__(self, path: Optional[str] = None):
+        path = path or default_path()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.db = sqlite3.connect(path)
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS samples (
+                key TEXT NOT NULL,
+                name TEXT,
+                duration REAL NOT NULL,
+                recorded_at REAL NOT NULL
+            )
+        """)
+        self.db.execute("CREATE INDEX IF NOT EXISTS samples_key ON samples (key, recorded_at)")
+        self._cache = {}
+
+    def close(self):
+        self.db.close()
+
+    def record(self, content: WindowContent, duration: float):
+        key = content_key(content)
+        with self.db:
+            self.db.execute(
+                "INSERT INTO samples (key, name, duration, recorded_at) VALUES (?, ?, ?, ?)",
+                (key, content.default_name, duration, time.time()),
+            )
+            self.db.execute(
+                """
+                DELETE FROM samples WHERE key = ? AND rowid NOT IN (
+                    SELECT rowid FROM samples WHERE key = ? ORDER BY recorded_at DESC LIMIT ?
+                )
+                """,
+                (key, key, SAMPLES_PER_KEY),
+            )
+        self._cache.pop(key, None)
+
+    def expected(self, content: WindowContent):
+        # Average of recent durations in seconds, None for apps we have never seen
+        key = content_key(content)
+        if key not in self._cache:
+            (self._cache[key],) = self.db.execute(
+                "SELECT AVG(duration) FROM samples WHERE key = ?", (key,)
+            ).fetchone()
+        return self._cache[key]
+
+    def order(self, launches):
+        # Slowest apps first; unknown ones go first, too, as they might be slow and we want to measure them
+        def expected(launch):
+            window, cmd = launch
+            if window is None:
+                return 0.0
+            e = self.expected(window.content)
+            return float("inf") if e is None else e
+        return sorted(launches, key=expected, reverse=True)
+
+    def report(self):
+        return self.db.execute("""
+            SELECT name, COUNT(*), AVG(duration), MIN(duration), MAX(duration), MAX(recorded_at)
+            FROM samples
+            GROUP BY key
+            ORDER BY AVG(duration) DESC
+        """).fetchall()
+
+def main():
+    parser = argparse.ArgumentParser(description="Show measured spawn-to-swallow durations")
+    parser.add_argument("--db", help=f"defaults to {default_path()}")
+    args = parser.parse_args()
+    history = History(args.db)
+    print(f"{'app':40} {'samples':>7} {'avg':>8} {'min':>8} {'max':>8}  last seen")
+    for name, samples, avg, low, high, last in history.report():
+        print(
+            f"{(name or '?')[:40]:40} {samples:7} {avg:7.2f}s {low:7.2f}s {high:7.2f}s  "
+            f"{time.strftime('%Y-%m-%d %H:%M', time.localtime(last))}"
+        )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,501 @@
+import argparse
+import asyncio
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from dataclasses import dataclass, field
+from itertools import count
+from typing import Dict, List, Optional
+
+from .ipc import HEADER, EVENT_MASK, EVENT_TYPES, RUN_COMMAND, GET_WORKSPACES, SUBSCRIBE, GET_OUTPUTS, GET_TREE, \
+    GET_MARKS, GET_VERSION, pack, unpack_header
+from .patterns import Pattern, Literal, Anything, AnyOf, CompoundPattern
+from .util import read_layout_file
+
+# Local stand-in for i3, good enough for running pyi3l end-to-end without a display.
+#
+# It speaks the IPC protocol on a UNIX socket and keeps an in-memory tree. It implements just what pyi3l uses:
+# RUN_COMMAND (workspace, append_layout, mark, unmark, kill, swap, move to mark/workspace, exec, nop, with
+# con_id/con_mark/class/instance/title/window_role criteria), GET_TREE, GET_WORKSPACES, GET_MARKS, GET_VERSION
+# and SUBSCRIBE to window/workspace events. Windows never appear by themselves; they are simulated by
+# open_window, usually via fake_launch.
+#
+# The tree is simplified: root → single output → content → workspaces.
+
+_ids = count(1)
+
+@dataclass
+class Con:
+    type: str = "con"
+    name: Optional[str] = None
+    layout: str = "splith"
+    nodes: List["Con"] = field(default_factory=list)
+    marks: List[str] = field(default_factory=list)
+    swallows: List[Dict[str, str]] = field(default_factory=list)
+    window: Optional[int] = None
+    window_properties: Optional[Dict[str, str]] = None
+    percent: Optional[float] = None
+    parent: Optional["Con"] = field(default=None, repr=False)
+    id: int = field(default_factory=lambda: next(_ids))
+
+    def add(self, con: "Con", index: Optional[int] = None):
+        con.parent = self
+        if index is None:
+            self.nodes.append(con)
+        else:
+            self.nodes.insert(index, con)
+        return con
+
+    def detach(self):
+        self.parent.nodes.remove(self)
+        self.parent = None
+
+    def walk(self):
+        yield self
+        for node in self.nodes:
+            yield from node.walk()
+
+    def is_placeholder(self):
+        return self.window is None and len(self.swallows) > 0
+
+    def to_json(self):
+        return {
+            "id": self.id,
+            "type": self.type,
+            "name": self.name,
+            "layout": self.layout,
+            "percent": self.percent,
+            "marks": self.marks,
+            "swallows": self.swallows,
+            "window": self.window,
+            "window_properties": self.window_properties,
+            "nodes": [node.to_json() for node in self.nodes],
+            "floating_nodes": [],
+        }
+
+def example(pattern: Optional[Pattern]):
+    # Some string matched by the pattern
+    if pattern is None or isinstance(pattern, Anything):
+        return ""
+    if isinstance(pattern, Literal):
+        return pattern.s
+    if isinstance(pattern, AnyOf):
+        return example(pattern.variants[0])
+    if isinstance(pattern, CompoundPattern):
+        return "".join(map(example, pattern.subpatterns))
+    raise ValueError(f"Cannot make an example for {pattern}")
+
+def split_commands(s: str):
+    # Splits by ; and , outside of quotes and criteria, returns [(separator before, command)]
+    parts = []
+    buff = ""
+    sep = ";"
+    quote = False
+    escaped = False
+    brackets = 0
+    for c in s:
+        if escaped:
+            escaped = False
+        elif quote and c == "\\":
+            escaped = True
+        elif c == '"':
+            quote = not quote
+        elif not quote and c == "[":
+            brackets += 1
+        elif not quote and c == "]":
+            brackets -= 1
+        if c in ";," and not quote and brackets == 0:
+            parts.append((sep, buff.strip()))
+            sep = c
+            buff = ""
+        else:
+            buff += c
+    parts.append((sep, buff.strip()))
+    return [(sep, cmd) for sep, cmd in parts if cmd != ""]
+
+def unquote(s: str):
+    if len(s) >= 2 and s.startswith('"') and s.endswith('"'):
+        return s[1:-1].replace('\\"', '"')
+    return s
+
+CRITERION = re.compile(r'(\w+)\s*=\s*(?:"((?:[^"\\]|\\.)*)"|(\S+?))(?=\s|\]|$)')
+WINDOW_PROPERTIES = {"class", "instance", "title", "window_role"}
+
+def parse_criteria(s: str):
+    # "[con_id=1 class="^x$"] rest" -> ({"con_id": "1", "class": "^x$"}, "rest")
+    if not s.startswith("["):
+        return None, s
+    end = s.index("]")
+    criteria = {
+        m.group(1): m.group(2).replace('\\"', '"') if m.group(2) is not None else m.group(3)
+        for m in CRITERION.finditer(s[1:end])
+    }
+    return criteria, s[end + 1:].strip()
+
+class I3Simulator:
+    def __init__(self, socket_path: str):
+        self.socket_path = socket_path
+        self.root = Con(type="root", name="root")
+        output = self.root.add(Con(type="output", name="sim"))
+        self.content = output.add(Con(type="con", name="content"))
+        self.focused_workspace = None
+        self.subscribers = {}   # writer -> set of event names
+        self.server = None
+        self.loop = None
+        self.thread = None
+        self.window_ids = count(0x800001)
+        self.executed = []      # commands passed to exec
+        self._workspace("1")
+
+    # workspaces and tree
+
+    def _workspace(self, name: str):
+        for ws in self.content.nodes:
+            if ws.name == name:
+                break
+        else:
+            ws = self.content.add(Con(type="workspace", name=name))
+            self._emit("workspace", {"change": "init", "current": ws.to_json()})
+        if ws is not self.focused_workspace:
+            old = self.focused_workspace
+            self.focused_workspace = ws
+            self._emit("workspace", {
+                "change": "focus",
+                "current": ws.to_json(),
+                "old": None if old is None else old.to_json(),
+            })
+        return ws
+
+    def cons(self):
+        return self.root.walk()
+
+    def placeholders(self):
+        return [con for con in self.cons() if con.is_placeholder()]
+
+    def windows(self):
+        return [con for con in self.cons() if con.window is not None]
+
+    def _build(self, j):
+        if "nodes" in j or "layout" in j:
+            con = Con(layout=j.get("layout", "splith"), marks=list(j.get("marks", [])), percent=j.get("percent"))
+            for node in j.get("nodes", []):
+                con.add(self._build(node))
+        else:
+            con = Con(
+                name=j.get("name"),
+                marks=list(j.get("marks", [])),
+                swallows=list(j.get("swallows", [])),
+                percent=j.get("percent"),
+                layout="splith",
+            )
+        return con
+
+    def append_layout(self, path: str):
+        for obj in read_layout_file(path):
+            self.focused_workspace.add(self._build(obj))
+
+    def _matches(self, con: Con, criteria: Dict[str, str]):
+        for key, value in criteria.items():
+            if key == "con_id":
+                if str(con.id) != value:
+                    return False
+            elif key == "con_mark":
+                if not any(re.search(value, mark) for mark in con.marks):
+                    return False
+            elif key in WINDOW_PROPERTIES:
+                if con.window is None or not re.search(value, con.window_properties.get(key) or ""):
+                    return False
+            else:
+                raise ValueError(f"Unsupported criterion {key}")
+        return True
+
+    def _find_mark(self, mark: str):
+        for con in self.cons():
+            if mark in con.marks:
+                return con
+        raise ValueError(f"No container with mark {mark}")
+
+    # commands
+
+    def run_command(self, cmd: str):
+        results = []
+        criteria = None
+        for sep, part in split_commands(cmd):
+            new_criteria, part = parse_criteria(part)
+            if new_criteria is not None or sep == ";":
+                criteria = new_criteria
+            try:
+                targets = (
+                    [con for con in self.cons() if con.type == "con" and self._matches(con, criteria)]
+                    if criteria is not None else
+                    None
+                )
+                self._run_single(part, targets)
+                results.append({"success": True})
+            except (ValueError, OSError) as e:
+                results.append({"success": False, "error": str(e)})
+        return results
+
+    def _run_single(self, cmd: str, targets: Optional[List[Con]]):
+        verb, _, rest = cmd.partition(" ")
+        rest = rest.strip()
+        args = rest.split()
+        if verb == "nop":
+            pass
+        elif verb == "exec":
+            self.executed.append(rest)
+        elif verb == "workspace":
+            args = [a for a in args if a not in ("--no-auto-back-and-forth", "number")]
+            self._workspace(" ".join(args))
+        elif verb == "append_layout":
+            self.append_layout(rest)
+        elif verb == "mark":
+            name = unquote(re.sub(r"^(--\S+\s+)*", "", rest))
+            for con in self._targets(targets):
+                if "--add" not in args:
+                    con.marks = []
+                for other in self.cons():
+                    if name in other.marks:
+                        other.marks.remove(name)
+                con.marks.append(name)
+        elif verb == "unmark":
+            for con in self.cons() if targets is None else targets:
+                con.marks = [m for m in con.marks if args and m != args[0]]
+        elif verb == "kill":
+            for con in self._targets(targets):
+                con.detach()
+                if con.window is not None:
+                    self._emit("window", {"change": "close", "container": con.to_json()})
+        elif verb == "swap":
+            # swap container with mark|con_id X
+            if args[:2] != ["container", "with"] or len(args) != 4:
+                raise ValueError(f"Unsupported command: {cmd}")
+            other = self._find_mark(args[3]) if args[2] == "mark" else next(
+                con for con in self.cons() if str(con.id) == args[3]
+            )
+            for con in self._targets(targets):
+                a_parent, a_index = con.parent, con.parent.nodes.index(con)
+                b_parent, b_index = other.parent, other.parent.nodes.index(other)
+                a_parent.nodes[a_index], b_parent.nodes[b_index] = other, con
+                con.parent, other.parent = b_parent, a_parent
+                con.percent, other.percent = other.percent, con.percent
+        elif verb == "move":
+            args = [a for a in args if a not in ("container", "window")]
+            if args[:2] == ["to", "mark"]:
+                target = self._find_mark(args[2])
+                for con in self._targets(targets):
+                    con.detach()
+                    target.parent.add(con, target.parent.nodes.index(target) + 1)
+            elif args[:2] == ["to", "workspace"]:
+                ws = self._workspace_by_name(" ".join(args[2:]))
+                for con in self._targets(targets):
+                    con.detach()
+                    ws.add(con)
+            else:
+                raise ValueError(f"Unsupported command: {cmd}")
+        else:
+            raise ValueError(f"Unsupported command: {cmd}")
+
+    def _workspace_by_name(self, name: str):
+        focused = self.focused_workspace
+        ws = self._workspace(name)
+        self._workspace(focused.name)
+        return ws
+
+    def _targets(self, targets: Optional[List[Con]]):
+        if targets is not None:
+            return targets
+        # without criteria, commands apply to the focused container; we approximate it by the last window
+        focused = [con for con in self.focused_workspace.walk() if con.type == "con"]
+        return focused[-1:]
+
+    # windows
+
+    def open_window(
+        self,
+        win_class: str,
+        instance: str,
+        title: str = "",
+        window_role: Optional[str] = None,
+        machine: Optional[str] = None,
+    ):
+        properties = {
+            "class": win_class,
+            "instance": instance,
+            "title": title,
+            "window_role": window_role,
+            "machine": machine,
+        }
+        con = next(
+            (
+                con
+                for con in self.placeholders()
+                if any(self._swallows(swallow, properties) for swallow in con.swallows)
+            ),
+            None
+        )
+        if con is None:
+            con = self.focused_workspace.add(Con())
+        con.swallows = []
+        con.window = next(self.window_ids)
+        con.window_properties = properties
+        con.name = title
+        self._emit("window", {"change": "new", "container": con.to_json()})
+        return con
+
+    @staticmethod
+    def _swallows(swallow: Dict[str, str], properties: Dict[str, Optional[str]]):
+        return all(
+            re.search(pattern, properties.get(key) or "") is not None
+            for key, pattern in swallow.items()
+        )
+
+    async def open_window_later(self, delay: float, **properties):
+        await asyncio.sleep(delay)
+        return self.open_window(**properties)
+
+    def fake_launch(self, delay: float = 0.0):
+        # Returns a launcher for exec.run that opens a window matching the first swallow of each Window after delay
+        def launch(windows, cmd):
+            for window in windows:
+                swallow = window.content.swallows[0]
+                properties = dict(
+                    win_class=example(swallow.win_class),
+                    instance=example(swallow.instance),
+                    title=example(swallow.title),
+                    window_role=None if swallow.window_role is None else example(swallow.window_role),
+                )
+                self.loop.call_soon_threadsafe(
+                    lambda properties=properties: self.loop.create_task(self.open_window_later(delay, **properties))
+                )
+        return launch
+
+    # IPC
+
+    def _emit(self, event: str, payload):
+        message = pack(EVENT_MASK | EVENT_TYPES[event], json.dumps(payload))
+        for writer, events in list(self.subscribers.items()):
+            if event in events:
+                writer.write(message)
+
+    def _reply(self, message_type: int, payload: str):
+        if message_type == RUN_COMMAND:
+            return self.run_command(payload)
+        elif message_type == GET_TREE:
+            return self.root.to_json()
+        elif message_type == GET_WORKSPACES:
+            return [
+                {"id": ws.id, "num": int(ws.name) if ws.name.isdigit() else -1, "name": ws.name,
+                 "focused": ws is self.focused_workspace, "visible": ws is self.focused_workspace, "output": "sim"}
+                for ws in self.content.nodes
+            ]
+        elif message_type == GET_OUTPUTS:
+            return [{"name": "sim", "active": True, "current_workspace": self.focused_workspace.name}]
+        elif message_type == GET_MARKS:
+            return [mark for con in self.cons() for mark in con.marks]
+        elif message_type == GET_VERSION:
+            return {"major": 4, "minor": 0, "patch": 0, "human_readable": "pyi3l simulator"}
+        else:
+            return {"success": False, "error": f"Unsupported message type {message_type}"}
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                length, message_type = unpack_header(await reader.readexactly(HEADER.size))
+                payload = (await reader.readexactly(length)).decode("utf-8")
+                if message_type == SUBSCRIBE:
+                    self.subscribers.setdefault(writer, set()).update(json.loads(payload))
+                    reply = {"success": True}
+                else:
+                    reply = self._reply(message_type, payload)
+                writer.write(pack(message_type, json.dumps(reply)))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.subscribers.pop(writer, None)
+            writer.close()
+
+    async def start(self):
+        self.loop = asyncio.get_running_loop()
+        self.server = await asyncio.start_unix_server(self._handle, path=self.socket_path)
+
+    async def close(self):
+        self.server.close()
+        await self.server.wait_closed()
+        for writer in list(self.subscribers):
+            writer.close()
+
+    def start_in_thread(self):
+        # Runs the simulator in a background thread, for use from synchronous code like exec.run
+        started = threading.Event()
+        def main():
+            self.loop = asyncio.new_event_loop()
+            self.loop.run_until_complete(self.start())
+            started.set()
+            self.loop.run_forever()
+        self.thread = threading.Thread(target=main, daemon=True)
+        self.thread.start()
+        started.wait()
+        return self
+
+    def call(self, f, *args, **kwargs):
+        # Calls f in the simulator thread and returns its result
+        async def call():
+            return f(*args, **kwargs)
+        return asyncio.run_coroutine_threadsafe(call(), self.loop).result()
+
+    def stop_thread(self):
+        asyncio.run_coroutine_threadsafe(self.close(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+
+
+def bench(windows: int, per_workspace: int, delay: float):
+    from .tree import Window, Tabbed
+    from .linux import xfce4_terminal
+    from .exec import run
+    d = {
+        ws + 1: Tabbed([
+            Window(xfce4_terminal(title=f"Terminal {ws}.{i}"))
+            for i in range(min(per_workspace, windows - ws * per_workspace))
+        ])
+        for ws in range((windows + per_workspace - 1) // per_workspace)
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        sim = I3Simulator(os.path.join(tmp, "ipc.sock")).start_in_thread()
+        try:
+            start = time.monotonic()
+            run(d, socket_path=sim.socket_path, launch=sim.fake_launch(delay))
+            applied = time.monotonic()
+            while sim.call(lambda: len(sim.placeholders())) > 0:
+                time.sleep(0.001)
+            done = time.monotonic()
+        finally:
+            sim.stop_thread()
+    print(f"{windows} windows on {len(d)} workspaces")
+    print(f"apply: {(applied - start) * 1000:.1f} ms")
+    print(f"all windows swallowed: {(done - start) * 1000:.1f} ms (window delay {delay * 1000:.0f} ms)")
+
+def main():
+    parser = argparse.ArgumentParser(description="i3 IPC simulator")
+    parser.add_argument("--serve", metavar="SOCKET", help="serve the simulated i3 on this socket until killed")
+    parser.add_argument("--bench", type=int, metavar="WINDOWS", help="apply a layout with this many windows")
+    parser.add_argument("--per-workspace", type=int, default=10)
+    parser.add_argument("--delay", type=float, default=0.0, help="seconds until a launched window appears")
+    args = parser.parse_args()
+    if args.bench is not None:
+        bench(args.bench, args.per_workspace, args.delay)
+    elif args.serve is not None:
+        async def serve():
+            await I3Simulator(args.serve).start()
+            await asyncio.Event().wait()
+        asyncio.run(serve())
+    else:
+        parser.print_usage()
+
+if __name__ == "__main__":
+    main()
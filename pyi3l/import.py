@@ -51,4 +51,4 @@ def read_objs(f, parse):
 
 in_json = json.load(sys.stdin)   #  TODO: other variants of read, expecially for existing layouts
 tree = Toplevel.import_toplevel(in_json)
-print(pythonize_full({None: tree}))
+write_full({None: tree}, sys.stdout)
@@ -0,0 +1,143 @@
+import argparse
+import json
+import os
+import sys
+
+from pyi3l.batch import output_paths, report, run_in_pool
+from pyi3l.util import content_hash, parse_layout, write_if_changed
+
+# Converts many existing append_layout JSON files to pyi3l scripts in a process pool:
+#
+#     python -m pyi3l.import_layouts ~/.i3/layouts/
+#
+# Each foo.json gets a foo.py next to it. Directories are searched for *.json files (not recursively).
+# Hashes of successfully converted inputs are kept in a cache file in each directory, so inputs that haven't
+# changed since the last run are skipped. Use --force after upgrading pyi3l.
+#
+# The cache also remembers what we have written, so an existing foo.py we didn't generate (e.g. a hand-written
+# layout script) is never overwritten, unless --overwrite is given.
+
+CACHE_NAME = ".pyi3l-import-cache.json"
+
+def input_paths(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                if name.endswith(".json") and name != CACHE_NAME:
+                    yield os.path.join(path, name)
+        else:
+            yield path
+
+def file_hash(path: str):
+    try:
+        with open(path, "rb") as f:
+            return content_hash(f.read())
+    except FileNotFoundError:
+        return None
+
+def convert(path: str, out: str, data: bytes, generated_hash: str = None, overwrite: bool = False):
+    # Returns (path, status, detail) where status is "written", "unchanged" or "error".
+    # generated_hash is the hash of out as we have written it last time, if ever.
+    from pyi3l.tree import Toplevel
+    from pyi3l.reverse_tree import pythonize_full
+    try:
+        content = pythonize_full({None: Toplevel.import_toplevel(parse_layout(data.decode("utf-8")))})
+        existing = file_hash(out)
+        if (
+            not overwrite and
+            existing is not None and
+            existing != generated_hash and
+            existing != content_hash(content.encode("utf-8"))
+        ):
+            return path, "error", f"{out} exists and wasn't generated from {path}, not overwriting it"
+        written = write_if_changed(out, content, mode=0o755)
+        return path, "written" if written else "unchanged", out
+    except BaseException as e:
+        return path, "error", f"{type(e).__name__}: {e}"
+
+class Cache:
+    # Hashes of converted inputs and of the outputs written for them, one cache file per directory
+
+    def __init__(self):
+        self.entries = {}   # directory -> {file name: {"input": hash, "output": hash}}
+        self.dirty = set()
+
+    def _load(self, directory: str):
+        if directory not in self.entries:
+            try:
+                with open(os.path.join(directory, CACHE_NAME)) as f:
+                    self.entries[directory] = json.load(f)
+            except (FileNotFoundError, ValueError):
+                self.entries[directory] = {}
+        return self.entries[directory]
+
+    def get(self, path: str):
+        directory, name = os.path.split(path)
+        entry = self._load(directory).get(name)
+        return entry if isinstance(entry, dict) else {}
+
+    def put(self, path: str, input_hash: str, output_hash: str):
+        directory, name = os.path.split(path)
+        self._load(directory)[name] = {"input": input_hash, "output": output_hash}
+        self.dirty.add(directory)
+
+    def save(self):
+        for directory in self.dirty:
+            write_if_changed(
+                os.path.join(directory, CACHE_NAME),
+                json.dumps(self.entries[directory], indent=1, sort_keys=True) + "\n",
+            )
+        self.dirty.clear()
+
+def import_all(paths, jobs: int = None, force: bool = False, overwrite: bool = False, cache: Cache = None):
+    # Yields (path, status, detail) in input order, status "skipped" means the input is unchanged since the
+    # last run. Raises ValueError when two inputs would be converted to the same file.
+    cache = cache if cache is not None else Cache()
+    paths = list(input_paths(paths))
+    outputs = output_paths(paths, extension=".py")
+    ready = {}      # path -> result of inputs that don't need a worker
+    hashes = {}
+    jobs_args = []
+    for path in paths:
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError as e:
+            ready[path] = path, "error", f"{type(e).__name__}: {e}"
+            continue
+        hashes[path] = content_hash(data)
+        entry = cache.get(path)
+        out = outputs[path]
+        if not force and entry.get("input") == hashes[path] and file_hash(out) == entry.get("output"):
+            ready[path] = path, "skipped", out
+        else:
+            jobs_args.append((path, out, data, entry.get("output"), overwrite))
+    results = run_in_pool(convert, jobs_args, jobs)
+    try:
+        for path in paths:
+            if path in ready:
+                yield ready[path]
+                continue
+            path, status, detail = next(results)
+            if status != "error":
+                cache.put(path, hashes[path], file_hash(outputs[path]))
+            yield path, status, detail
+    finally:
+        results.close()
+        cache.save()
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert i3 JSON layouts to pyi3l scripts in parallel")
+    parser.add_argument("paths", nargs="+", metavar="FILE_OR_DIRECTORY")
+    parser.add_argument("-j", "--jobs", type=int)
+    parser.add_argument("--force", action="store_true", help="convert also files that haven't changed")
+    parser.add_argument("--overwrite", action="store_true", help="overwrite .py files not generated by us")
+    args = parser.parse_args()
+    try:
+        results = import_all(args.paths, jobs=args.jobs, force=args.force, overwrite=args.overwrite)
+        sys.exit(report(results))
+    except ValueError as e:
+        parser.error(str(e))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+import asyncio
+import json
+import os
+import select
+import socket
+import struct
+import subprocess
+import sys
+from typing import List, Optional
+
+# Minimal client for the i3 IPC protocol, see https://i3wm.org/docs/ipc.html
+
+MAGIC = b"i3-ipc"
+HEADER = struct.Struct("=6sII")   # i3 uses native byte order
+
+RUN_COMMAND = 0
+GET_WORKSPACES = 1
+SUBSCRIBE = 2
+GET_OUTPUTS = 3
+GET_TREE = 4
+GET_MARKS = 5
+GET_VERSION = 7
+
+EVENT_MASK = 1 << 31
+EVENTS = {
+    0: "workspace",
+    1: "output",
+    2: "mode",
+    3: "window",
+    4: "barconfig_update",
+    5: "binding",
+    6: "shutdown",
+    7: "tick",
+}
+EVENT_TYPES = {name: t for t, name in EVENTS.items()}
+
+def socket_path():
+    path = os.environ.get("I3SOCK")
+    if path:
+        return path
+    return subprocess.run(
+        ["i3", "--get-socketpath"],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout.strip()
+
+def pack(message_type: int, payload: str = ""):
+    data = payload.encode("utf-8")
+    return HEADER.pack(MAGIC, len(data), message_type) + data
+
+def unpack_header(data: bytes):
+    magic, length, message_type = HEADER.unpack(data)
+    if magic != MAGIC:
+        raise ValueError(f"Bad i3 IPC magic: {magic}")
+    return length, message_type
+
+class Connection:
+    def __init__(self, path: Optional[str] = None):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(path or socket_path())
+        self.events = []  # events received while waiting for a reply
+
+    def close(self):
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _recv_exact(self, n: int):
+        buff = b""
+        while len(buff) < n:
+            chunk = self.sock.recv(n - len(buff))
+            if len(chunk) == 0:
+                raise ConnectionError("i3 closed the IPC connection")
+            buff += chunk
+        return buff
+
+    def _read_message(self, timeout: Optional[float] = None):
+        # Returns (type, payload), or None when nothing arrives within timeout
+        if timeout is not None:
+            readable, _, _ = select.select([self.sock], [], [], max(timeout, 0))
+            if not readable:
+                return None
+        length, message_type = unpack_header(self._recv_exact(HEADER.size))
+        return message_type, json.loads(self._recv_exact(length))
+
+    def request(self, message_type: int, payload: str = ""):
+        self.sock.sendall(pack(message_type, payload))
+        while True:
+            reply_type, reply = self._read_message()
+            if reply_type & EVENT_MASK:
+                self.events.append((EVENTS.get(reply_type & ~EVENT_MASK), reply))
+            else:
+                return reply
+
+    def command(self, cmd: str):
+        return self.request(RUN_COMMAND, cmd)
+
+    def get_tree(self):
+        return self.request(GET_TREE)
+
+    def get_workspaces(self):
+        return self.request(GET_WORKSPACES)
+
+    def subscribe(self, events: List[str]):
+        reply = self.request(SUBSCRIBE, json.dumps(events))
+        if not reply.get("success"):
+            raise ValueError(f"Cannot subscribe to {events}: {reply}")
+
+    def read_event(self, timeout: Optional[float] = None):
+        # Returns (event name, payload), or None when no event arrives within timeout
+        if self.events:
+            return self.events.pop(0)
+        message = self._read_message(timeout)
+        if message is None:
+            return None
+        message_type, payload = message
+        return EVENTS.get(message_type & ~EVENT_MASK), payload
+
+
+class AsyncConnection:
+    # asyncio counterpart of Connection, so that one thread can talk to several i3 instances (see pyi3l.daemon)
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+        self.events = []  # events received while waiting for a reply
+
+    @staticmethod
+    async def open(path: Optional[str] = None):
+        reader, writer = await asyncio.open_unix_connection(path or socket_path())
+        return AsyncConnection(reader, writer)
+
+    async def close(self):
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except ConnectionError:
+            pass
+
+    async def _read_message(self, timeout: Optional[float] = None):
+        # Returns (type, payload), or None when nothing arrives within timeout.
+        # Only waiting for the header can time out; a cancelled readexactly doesn't consume partial data.
+        try:
+            header = await asyncio.wait_for(
+                self.reader.readexactly(HEADER.size),
+                None if timeout is None else max(timeout, 0),
+            )
+            length, message_type = unpack_header(header)
+            return message_type, json.loads(await self.reader.readexactly(length))
+        except asyncio.TimeoutError:
+            return None
+        except asyncio.IncompleteReadError:
+            raise ConnectionError("i3 closed the IPC connection")
+
+    async def request(self, message_type: int, payload: str = ""):
+        self.writer.write(pack(message_type, payload))
+        await self.writer.drain()
+        while True:
+            reply_type, reply = await self._read_message()
+            if reply_type & EVENT_MASK:
+                self.events.append((EVENTS.get(reply_type & ~EVENT_MASK), reply))
+            else:
+                return reply
+
+    async def command(self, cmd: str):
+        return await self.request(RUN_COMMAND, cmd)
+
+    async def get_tree(self):
+        return await self.request(GET_TREE)
+
+    async def subscribe(self, events: List[str]):
+        reply = await self.request(SUBSCRIBE, json.dumps(events))
+        if not reply.get("success"):
+            raise ValueError(f"Cannot subscribe to {events}: {reply}")
+
+    async def read_event(self, timeout: Optional[float] = None):
+        # Returns (event name, payload), or None when no event arrives within timeout
+        if self.events:
+            return self.events.pop(0)
+        message = await self._read_message(timeout)
+        if message is None:
+            return None
+        message_type, payload = message
+        return EVENTS.get(message_type & ~EVENT_MASK), payload
+
+
+def quote(s: str):
+    # Quotes an argument of an i3 command (e.g. a mark with spaces or ;), i3 unescapes just \"
+    return '"' + s.replace('"', '\\"') + '"'
+
+def report_failures(results):
+    for result in results:
+        if not result.get("success"):
+            print(f"i3: {result.get('error')}", file=sys.stderr)
+
+def iter_cons(tree):
+    # All containers of a GET_TREE reply, depth-first, in layout order
+    stack = [tree]
+    while stack:
+        con = stack.pop()
+        yield con
+        stack.extend(reversed([*con.get("nodes", []), *con.get("floating_nodes", [])]))
@@ -1,22 +1,25 @@
 from dataclasses import dataclass, replace
-from typing import Optional
+from typing import Dict, List, Optional
 from functools import partial
-from .tree import WindowContent, SystemCommand, Command, Swallow, CmdModifier
+from .tree import WindowContent, SystemCommand, Command, Swallow, CmdModifier, ModifiedCommand, Invocation
 from .patterns import Literal, Anything, AnyOf, CompoundPattern
 import os.path
+import shlex
+import subprocess
 
 @dataclass
 class WorkingDir(CmdModifier):
     directory: str
 
     def adjust_command(self, cmd: Command):
-        return SystemCommand([
-            "env",
-            "-C",
-            self.directory,
-            "--",
-            *cmd.to_system_command(),
-        ])
+        return ModifiedCommand.of(cmd, cwd=self.directory)
+
+@dataclass
+class Environment(CmdModifier):
+    variables: Dict[str, str]
+
+    def adjust_command(self, cmd: Command):
+        return ModifiedCommand.of(cmd, env=self.variables)
 
 def firefox():
     return WindowContent(
@@ -31,6 +34,26 @@ def firefox():
         ],
     )
 
+@dataclass
+class ChromiumCommand(Command):
+    args: List[str]
+    # Note that Chromium respects --class only when it starts a new browser process. When Chromium is already
+    # running (with the same profile), the new window gets the usual class and won't be swallowed by an exact
+    # key placeholder.
+    wm_class: Optional[str] = None
+
+    def run(self):
+        subprocess.run(self.to_system_command())
+
+    def to_shell_command(self):
+        return shlex.join(self.to_system_command())
+
+    def to_system_command(self):
+        return ["chromium", *([f"--class={self.wm_class}"] if self.wm_class is not None else []), *self.args]
+
+    def with_window_key(self, key: str):
+        return replace(self, wm_class=key), Swallow(win_class=Literal(key))
+
 def chromium(url=None):
     return WindowContent(
         swallows = [
@@ -39,7 +62,7 @@ def chromium(url=None):
                 instance=Literal("chromium-browser"),
             ),
         ],
-        commands = [SystemCommand(["chromium", *([] if url is None else [url])])],
+        commands = [ChromiumCommand([] if url is None else [url])],
         default_name = "Chromium" if url is None else f"Chromium: {url}"
     )
 
@@ -64,7 +87,7 @@ def chromium_app(url, instance_override = None):
                 instance=Literal(instance),
             ),
         ],
-        commands = [SystemCommand(["chromium", f"--app={url}"])],
+        commands = [ChromiumCommand([f"--app={url}"])],
         default_name = url
     )
 
@@ -133,7 +156,7 @@ def visual_studio_code(path: Optional[str] = None):
                 ]),
             )
         ],
-        commands = [SystemCommand(filter(lambda x: x is not None, ["code", path]))]
+        commands = [SystemCommand(list(filter(lambda x: x is not None, ["code", path])))]
     )
 
 def element_io():
@@ -167,6 +190,47 @@ def toggl_chromium():
     )
 
 
+@dataclass
+class Xfce4TerminalCommand(Command):
+    # xfce4-terminal can open several windows from a single invocation, so launches of it can be coalesced
+    title: Optional[str] = None
+    command: Optional[Command] = None
+    role: Optional[str] = None
+
+    def window_options(self, merged: bool):
+        invocation = None if self.command is None else self.command.to_invocation()
+        if invocation is not None:
+            argv = Invocation(invocation.argv, env=invocation.env).to_system_command()
+        return [
+            *([f"--title={self.title}"] if self.title is not None else []),
+            *([f"--role={self.role}"] if self.role is not None else []),
+            *([f"--working-directory={invocation.cwd}"] if invocation is not None and invocation.cwd is not None else []),
+            # -x takes the rest of the command line, so it can't be used when more windows follow
+            *([] if invocation is None else ["-e", shlex.join(argv)] if merged else ["-x", *argv]),
+        ]
+
+    def run(self):
+        subprocess.run(self.to_system_command())
+
+    def to_shell_command(self):
+        return shlex.join(self.to_system_command())
+
+    def to_system_command(self):
+        return ["xfce4-terminal", *self.window_options(merged=False)]
+
+    def coalesce_key(self):
+        return ("xfce4-terminal",)
+
+    def with_window_key(self, key: str):
+        return replace(self, role=key), Swallow(window_role=Literal(key))
+
+    def coalesce(self, others):
+        return SystemCommand([
+            "xfce4-terminal",
+            *self.window_options(merged=True),
+            *[option for other in others for option in ["--window", *other.window_options(merged=True)]],
+        ])
+
 def xfce4_terminal(title = None, command: Optional[Command] = None):
     title_pattern = (Literal("Terminal - ") + Anything()) | Literal("Terminal") if title is None else Literal(title)
     return WindowContent(
@@ -184,13 +248,7 @@ def xfce4_terminal(title = None, command: Optional[Command] = None):
             ),
         ],
         default_name = title or "Terminal",
-        commands = [
-            SystemCommand([
-                "xfce4-terminal",
-                *([f"--title={title}"] if title is not None else []),
-                *(["-x", *command.to_system_command()] if command is not None else []),
-            ]),
-        ]
+        commands = [Xfce4TerminalCommand(title, command)],
     )
 
 
@@ -3,6 +3,8 @@ from abc import ABC, abstractmethod
 from typing import List, Optional
 from .util import pcre_quote
 from functools import reduce
+import os.path
+import re
 
 
 class Pattern(ABC):
@@ -19,52 +21,106 @@ class Pattern(ABC):
         return CompoundPattern([self, other])
 
     def __or__(self, other: "Pattern"):
+        if isinstance(other, AnyOf):
+            return AnyOf([self, *other.variants])
         return AnyOf([self, other])
 
+    def literal_prefix(self):
+        # Every string matched by the pattern starts with this prefix
+        return ""
+
+    def compile(self, automaton: "Automaton", start: int):
+        # Adds the pattern to the automaton, starting at state start, and returns its final state.
+        # Patterns we can't analyze (e.g. Raw) are over-approximated as Anything.
+        return Anything().compile(automaton, start)
+
+    def to_automaton(self):
+        automaton = Automaton()
+        automaton.accepting = self.compile(automaton, automaton.add_state())
+        return automaton
+
+    def intersects(self, other: "Pattern"):
+        # True if some string is matched by both patterns (or if we can't rule it out for Raw patterns)
+        return self.to_automaton().intersects(other.to_automaton())
+
+    def covers(self, other: "Pattern"):
+        # Conservative check that every string matched by other is also matched by self.
+        # False negatives are fine, false positives are not.
+        if isinstance(other, AnyOf):
+            return all(map(self.covers, other.variants))
+        return self == other
+
     @staticmethod
     def import_pattern(s):
         if s is None:
             return None
         else:
             if s.startswith("^") and s.endswith("$"):
-                return Pattern.import_pattern_part(s[1:-1]).optimize()
+                # no optimize(), adjacent characters are already merged, and its reduce would be quadratic
+                return Pattern.import_pattern_part(s[1:-1])
             else:
                 raise ValueError("Cannot import pattern "+s)
 
     @staticmethod
     def import_pattern_part(s):
-        def unsupported(s):
-            raise ValueError(f"Unsupported pattern part: {s}")
-
-        def import_default(s):
-            return Literal(s[0]) + Pattern.import_pattern_part(s[1:])
-
-        def import_escaped(s):
-            if len(s) < 2:
-                raise ValueError("Missing character after escape")
-            c = s[1]
-            rest = s[2:]
-            if c.isalpha():
-                raise ValueError(f"Unsupported escape char: {c}")
-            return Literal(c) + Pattern.import_pattern_part(rest)
-
-        if s == "":
-            return Literal("")
-        else:
-            return {
-                ".": unsupported,
-                "^": unsupported,
-                "$": unsupported,
-                "*": unsupported,
-                "+": unsupported,
-                "?": unsupported,
-                "(": unsupported,
-                ")": unsupported,
-                "[": unsupported,
-                "{": unsupported,
-                "\\": import_escaped,
-                "|": unsupported,
-            }.get(s[0], import_default)(s)
+        # Single pass with an explicit stack of open groups, so long titles neither recurse nor copy the rest
+        # of the string for every character. Each group is a list of alternatives, each alternative a list of
+        # patterns. Consecutive plain characters are collected in literal and become a single Literal.
+        groups = [[[]]]
+        literal = []
+
+        def flush():
+            if literal:
+                groups[-1][-1].append(Literal("".join(literal)))
+                literal.clear()
+
+        def sequence(parts):
+            if len(parts) == 0:
+                return Literal("")
+            elif len(parts) == 1:
+                return parts[0]
+            else:
+                return CompoundPattern(parts)
+
+        i = 0
+        while i < len(s):
+            c = s[i]
+            if c == "\\":
+                if i + 1 == len(s):
+                    raise ValueError("Missing character after escape")
+                c = s[i + 1]
+                if c.isalnum():
+                    raise ValueError(f"Unsupported escape char: {c}")
+                literal.append(c)
+                i += 1
+            elif s.startswith(".*", i):
+                flush()
+                groups[-1][-1].append(Anything())
+                i += 1
+            elif c == "(":
+                flush()
+                groups.append([[]])
+            elif c == "|":
+                if len(groups) == 1:
+                    # ^a|b$ means (^a)|(b$), which is not what the exported patterns look like
+                    raise ValueError(f"Unsupported alternation outside of a group: {s}")
+                flush()
+                groups[-1].append([])
+            elif c == ")":
+                if len(groups) == 1:
+                    raise ValueError(f"Unbalanced parenthesis: {s}")
+                flush()
+                alternatives = groups.pop()
+                groups[-1][-1].append(AnyOf(list(map(sequence, alternatives))))
+            elif c in ".^$*+?[{":
+                raise ValueError(f"Unsupported pattern part: {s[i:]}")
+            else:
+                literal.append(c)
+            i += 1
+        if len(groups) > 1:
+            raise ValueError(f"Unbalanced parenthesis: {s}")
+        flush()
+        return sequence(groups[0][0])
 
     def optimize(self):
         return self
@@ -82,12 +138,22 @@ class Literal(Pattern):
     def map_chars(self, f):
         return Literal("".join(map(f, self.s)))
 
+    def literal_prefix(self):
+        return self.s
+
+    def compile(self, automaton: "Automaton", start: int):
+        state = start
+        for c in self.s:
+            state = automaton.add_transition(state, c)
+        return state
+
     def __add__(self, other: "Pattern"):
         if isinstance(other, Literal):
             return Literal(self.s+other.s)
         else:
             return CompoundPattern([self, other])
 
+@dataclass
 class Anything(Pattern):
     def to_pcre(self):
         return ".*"
@@ -98,6 +164,15 @@ class Anything(Pattern):
     def map_chars(self, f):
         return self
 
+    def covers(self, other: "Pattern"):
+        return not isinstance(other, Raw)
+
+    def compile(self, automaton: "Automaton", start: int):
+        loop = automaton.add_state()
+        automaton.add_epsilon(start, loop)
+        automaton.add_transition(loop, ANY, loop)
+        return loop
+
 @dataclass
 class AnyOf(Pattern):
     variants: List[Pattern]
@@ -118,8 +193,26 @@ class AnyOf(Pattern):
             variants=list(map(lambda c: c.optimize(), self.variants)),
         )
 
+    def literal_prefix(self):
+        return os.path.commonprefix(list(map(lambda p: p.literal_prefix(), self.variants)))
+
+    def compile(self, automaton: "Automaton", start: int):
+        end = automaton.add_state()
+        for variant in self.variants:
+            variant_start = automaton.add_state()
+            automaton.add_epsilon(start, variant_start)
+            automaton.add_epsilon(variant.compile(automaton, variant_start), end)
+        return end
+
+    def covers(self, other: "Pattern"):
+        if isinstance(other, AnyOf):
+            return all(map(self.covers, other.variants))
+        return any(map(lambda v: v.covers(other), self.variants))
+
     # just optimized version
     def __or__(self, other: "Pattern"):
+        if isinstance(other, AnyOf):
+            return AnyOf([*self.variants, *other.variants])
         return AnyOf([*self.variants, other])
 
 
@@ -147,6 +240,29 @@ class CompoundPattern(Pattern):
             map(lambda c: c.optimize(), self.subpatterns)
         )
 
+    def compile(self, automaton: "Automaton", start: int):
+        return reduce(lambda state, p: p.compile(automaton, state), self.subpatterns, start)
+
+    def literal_prefix(self):
+        prefix = ""
+        for p in self.subpatterns:
+            prefix += p.literal_prefix()
+            if not isinstance(p, Literal):
+                break
+        return prefix
+
+    def covers(self, other: "Pattern"):
+        # Handles the common "prefix.*" shape, e.g. Literal("Terminal - ") + Anything()
+        if (
+            len(self.subpatterns) == 2 and
+            isinstance(self.subpatterns[0], Literal) and
+            isinstance(self.subpatterns[1], Anything) and
+            not isinstance(other, AnyOf) and
+            not isinstance(other, Raw)
+        ):
+            return other.literal_prefix().startswith(self.subpatterns[0].s)
+        return super().covers(other)
+
 
 @dataclass
 class Raw(Pattern):
@@ -166,3 +282,53 @@ class Raw(Pattern):
 
     def map_chars(self, f):
         raise Error(f"Cannot map chars of raw pattern {self}")
+
+
+ANY = None  # transition label matching any character
+
+class Automaton:
+    # Nondeterministic finite automaton over characters, with epsilon transitions and a single accepting state
+
+    def __init__(self):
+        self.transitions = []   # per state: list of (char or ANY, target)
+        self.epsilons = []      # per state: list of targets
+        self.accepting = None
+
+    def add_state(self):
+        self.transitions.append([])
+        self.epsilons.append([])
+        return len(self.transitions) - 1
+
+    def add_transition(self, source: int, label: Optional[str], target: Optional[int] = None):
+        if target is None:
+            target = self.add_state()
+        self.transitions[source].append((label, target))
+        return target
+
+    def add_epsilon(self, source: int, target: int):
+        self.epsilons[source].append(target)
+
+    def intersects(self, other: "Automaton"):
+        # Searches the product automaton for a path to a pair of accepting states
+        start = (0, 0)
+        seen = {start}
+        stack = [start]
+        while stack:
+            p, q = stack.pop()
+            if p == self.accepting and q == other.accepting:
+                return True
+            successors = [
+                *[(p2, q) for p2 in self.epsilons[p]],
+                *[(p, q2) for q2 in other.epsilons[q]],
+                *[
+                    (p2, q2)
+                    for l1, p2 in self.transitions[p]
+                    for l2, q2 in other.transitions[q]
+                    if l1 is ANY or l2 is ANY or l1 == l2
+                ],
+            ]
+            for pair in successors:
+                if pair not in seen:
+                    seen.add(pair)
+                    stack.append(pair)
+        return False
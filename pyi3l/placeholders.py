@@ -0,0 +1,163 @@
+import os
+import sys
+import time
+from dataclasses import dataclass, replace
+from itertools import count
+from typing import Dict, List, Optional
+
+from pyi3l.tree import Window, Command
+from pyi3l.ipc import Connection
+
+# Tracking of placeholders created by append_layout.
+#
+# Each Window gets a generated mark, so we can recognize its placeholder in i3 window events (i3 keeps the
+# marks when a placeholder swallows a window). Marks starting with an underscore aren't displayed by i3.
+# Placeholders not filled within their timeout are reported, or removed.
+
+MARK_PREFIX = "_pyi3l_"
+
+RUN_ID = f"{os.getpid():x}{int(time.time()) & 0xffffff:x}"
+_mark_counter = count()     # shared by all calls, so marks stay unique when a script is reloaded (see watch)
+
+def mark_windows(d):
+    # Returns a copy of the workspace → Toplevel dict where each Window has a unique generated mark.
+    # Windows already having one keep it.
+    def add_mark(window: Window):
+        if generated_mark(window) is not None:
+            return window
+        return replace(window, marks=[*(window.marks or []), f"{MARK_PREFIX}{RUN_ID}_{next(_mark_counter)}"])
+    return {ws: layout.map_windows(add_mark) for ws, layout in d.items()}
+
+def generated_mark(window: Window):
+    return next((mark for mark in window.marks or [] if mark.startswith(MARK_PREFIX)), None)
+
+def without_generated_marks(window: Window):
+    return replace(window, marks=[mark for mark in window.marks or [] if not mark.startswith(MARK_PREFIX)] or None)
+
+def criteria(mark: str):
+    return f'[con_mark="^{mark}$"]'
+
+@dataclass
+class Placeholder:
+    mark: str
+    ws: object
+    window: Window
+    commands: List[Command]
+    timeout: Optional[float] = None
+    created_at: Optional[float] = None
+    launched_at: Optional[float] = None
+    filled_at: Optional[float] = None
+
+    def name(self):
+        return self.window.name or self.window.content.default_name or self.mark
+
+    def deadline(self):
+        if self.timeout is None:
+            return None
+        return (self.launched_at or self.created_at) + self.timeout
+
+class PlaceholderTracker:
+    def __init__(
+        self,
+        connection: Connection,
+        default_timeout: Optional[float] = None,
+        remove_stale: bool = False,
+        on_filled = None,
+        out = sys.stderr,
+    ):
+        # connection has to be dedicated for events, it's subscribed to window events.
+        # Without a connection, the caller feeds events to handle() itself (see pyi3l.daemon).
+        self.connection = connection
+        self.default_timeout = default_timeout
+        self.remove_stale = remove_stale
+        self.on_filled = on_filled
+        self.out = out
+        self.pending: Dict[str, Placeholder] = {}
+        self.filled: List[Placeholder] = []
+        self.stale: List[Placeholder] = []
+        if connection is not None:
+            self.connection.subscribe(["window"])
+
+    def track(self, ws, layout):
+        # Registers all marked windows of the toplevel, call after append_layout
+        now = time.monotonic()
+        for window in windows_of(layout):
+            mark = generated_mark(window)
+            if mark is not None:
+                self.pending[mark] = Placeholder(
+                    mark, ws, window, window.to_commands(), self._timeout(window), created_at=now
+                )
+
+    def _timeout(self, window: Window):
+        return window.content.timeout if window.content.timeout is not None else self.default_timeout
+
+    def adopted(self, marks):
+        # Placeholders filled by existing windows (see pyi3l.adopt) don't wait for anything
+        for mark in marks:
+            self.pending.pop(mark, None)
+
+    def launched(self, window: Optional[Window]):
+        mark = generated_mark(window) if window is not None else None
+        if mark in self.pending and self.pending[mark].launched_at is None:
+            self.pending[mark].launched_at = time.monotonic()
+
+    def handle(self, event, payload):
+        if event != "window" or payload.get("change") != "new":
+            return
+        for mark in payload.get("container", {}).get("marks", []):
+            placeholder = self.pending.pop(mark, None)
+            if placeholder is not None:
+                placeholder.filled_at = time.monotonic()
+                self.filled.append(placeholder)
+                if self.on_filled is not None:
+                    self.on_filled(placeholder)
+
+    def expire(self, now: float):
+        expired = [p for p in self.pending.values() if p.deadline() is not None and p.deadline() <= now]
+        for placeholder in expired:
+            del self.pending[placeholder.mark]
+            self.stale.append(placeholder)
+            commands = "; ".join(map(lambda c: c.to_shell_command(), placeholder.commands)) or "(no command)"
+            action = "removing it" if self.remove_stale else "keeping it"
+            print(
+                f"Placeholder {placeholder.name()!r} on workspace {placeholder.ws} not filled "
+                f"after {placeholder.timeout}s, {action}. Expected from: {commands}",
+                file=self.out,
+            )
+        return expired
+
+    def next_deadline(self):
+        return min((p.deadline() for p in self.pending.values() if p.deadline() is not None), default=None)
+
+    def wait(self, command_connection: Connection, keep_marks: bool = False):
+        # Processes window events until every placeholder with a timeout is either filled or stale.
+        # Blocks on the event socket until the nearest deadline, no polling.
+        while (deadline := self.next_deadline()) is not None:
+            message = self.connection.read_event(timeout=deadline - time.monotonic())
+            if message is not None:
+                self.handle(*message)
+            expired = self.expire(time.monotonic())
+            if expired and self.remove_stale:
+                command_connection.command(kill_command(expired))
+        # consume events that have already arrived, to record as many fills as possible
+        while (message := self.connection.read_event(timeout=0)) is not None:
+            self.handle(*message)
+        # we stop watching here, so the generated marks aren't needed anymore; placeholders still waiting
+        # (without a timeout, or stale ones we keep) would otherwise pass them on to the windows filling them,
+        # unless keep_marks asks to leave them to the caller
+        settled = [*self.filled]
+        if not keep_marks:
+            settled += [*self.pending.values(), *([] if self.remove_stale else self.stale)]
+        if settled:
+            command_connection.command(unmark_command([p.mark for p in settled]))
+
+def kill_command(placeholders: List[Placeholder]):
+    return ";".join(f"{criteria(p.mark)} kill" for p in placeholders)
+
+def unmark_command(marks: List[str]):
+    return ";".join(f"{criteria(mark)} unmark {mark}" for mark in marks)
+
+def windows_of(element):
+    windows = []
+    element.map_windows(lambda w: windows.append(w) or w)
+    return windows
@@ -0,0 +1,303 @@
+import glob
+import os
+import shlex
+import shutil
+import struct
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+from pyi3l.tree import Command, ENV_ASSIGNMENT
+
+# Prefetching of executables and their libraries into the page cache, so that cold starts (spinning disks,
+# network home directories) read the files in parallel rather than one app at a time.
+#
+# For each command we resolve the executable (argv[0] via PATH, the first word of `bash -c` scripts),
+# interpreters of scripts (#!), and shared libraries the ELF files need (DT_NEEDED, transitively). Extra paths
+# (e.g. JetBrains install dirs, which are mostly jars) can be added; directories are prefetched recursively.
+# Resolving and posix_fadvise(WILLNEED) calls run in a thread pool, while the layout is being applied and the
+# apps launched. The kernel then reads the files in background.
+
+SHELLS = {"sh", "bash", "dash", "zsh"}
+MAX_SHEBANG_DEPTH = 4
+
+PT_LOAD = 1
+PT_DYNAMIC = 2
+PT_INTERP = 3
+DT_NULL = 0
+DT_NEEDED = 1
+DT_STRTAB = 5
+DT_RPATH = 15
+DT_RUNPATH = 29
+
+def command_executables(cmd: Command):
+    # Names or paths of programs the command starts directly
+    invocation = cmd.to_invocation()
+    argv = invocation.argv
+    if len(argv) == 0:
+        return []
+    programs = [argv[0]]
+    if os.path.basename(argv[0]) in SHELLS and len(argv) > 2 and argv[1] == "-c":
+        try:
+            words = shlex.split(argv[2])
+        except ValueError:
+            words = []
+        programs += [word for word in words if not ENV_ASSIGNMENT.match(word)][:1]
+    search_path = (invocation.env or {}).get("PATH", os.environ.get("PATH"))
+    resolved = []
+    for program in programs:
+        if "/" in program:
+            path = os.path.join(invocation.cwd or "", program)
+        else:
+            path = shutil.which(program, path=search_path)
+        if path is not None and os.path.isfile(path):
+            resolved.append(path)
+    return resolved
+
+def shebang_interpreter(path: str):
+    # The interpreter of a #! script, or None
+    try:
+        with open(path, "rb") as f:
+            head = f.read(256)
+    except OSError:
+        return None
+    if not head.startswith(b"#!"):
+        return None
+    words = head[2:].split(b"\n", 1)[0].decode(errors="replace").split()
+    if not words:
+        return None
+    if os.path.basename(words[0]) == "env":
+        args = [word for word in words[1:] if not word.startswith("-")]
+        return shutil.which(args[0]) if args else None
+    return words[0]
+
+def library_dirs(conf: str = "/etc/ld.so.conf"):
+    # Directories searched by the dynamic loader, approximately: ld.so.conf (with includes) and the defaults
+    dirs = []
+    def read(path):
+        try:
+            with open(path) as f:
+                lines = f.read().splitlines()
+        except OSError:
+            return
+        for line in lines:
+            line = line.split("#", 1)[0].strip()
+            if line.startswith("include "):
+                pattern = line[len("include "):].strip()
+                for included in sorted(glob.glob(os.path.join(os.path.dirname(path), pattern))):
+                    read(included)
+            elif line:
+                dirs.append(line)
+    read(conf)
+    return [*dirs, "/lib64", "/usr/lib64", "/lib", "/usr/lib"]
+
+def read_elf(path: str):
+    # Returns (interpreter, needed libraries, run path) of a dynamically linked ELF file, or None
+    try:
+        with open(path, "rb") as f:
+            ident = f.read(16)
+            if len(ident) < 16 or ident[:4] != b"\x7fELF":
+                return None
+            is64 = ident[4] == 2
+            endian = "<" if ident[5] == 1 else ">"
+            f.seek(0)
+            header = f.read(64 if is64 else 52)
+            if is64:
+                phoff, = struct.unpack_from(endian + "Q", header, 32)
+                phentsize, phnum = struct.unpack_from(endian + "HH", header, 54)
+                phdr = struct.Struct(endian + "IIQQQQQQ")   # type, flags, offset, vaddr, paddr, filesz, memsz, align
+                dyn = struct.Struct(endian + "qQ")
+            else:
+                phoff, = struct.unpack_from(endian + "I", header, 28)
+                phentsize, phnum = struct.unpack_from(endian + "HH", header, 42)
+                phdr = struct.Struct(endian + "IIIIIIII")   # type, offset, vaddr, paddr, filesz, memsz, flags, align
+                dyn = struct.Struct(endian + "iI")
+            f.seek(phoff)
+            table = f.read(phentsize * phnum)
+            segments = []   # (type, offset, vaddr, filesz)
+            for i in range(phnum):
+                fields = phdr.unpack_from(table, i * phentsize)
+                if is64:
+                    segments.append((fields[0], fields[2], fields[3], fields[5]))
+                else:
+                    segments.append((fields[0], fields[1], fields[2], fields[4]))
+
+            def file_offset(vaddr):
+                for kind, offset, start, size in segments:
+                    if kind == PT_LOAD and start <= vaddr < start + size:
+                        return vaddr - start + offset
+                return None
+
+            def string(offset):
+                f.seek(offset)
+                return f.read(4096).split(b"\0", 1)[0].decode(errors="replace")
+
+            interpreter = None
+            entries = []
+            for kind, offset, vaddr, size in segments:
+                if kind == PT_INTERP:
+                    f.seek(offset)
+                    interpreter = f.read(size).rstrip(b"\0").decode(errors="replace")
+                elif kind == PT_DYNAMIC:
+                    f.seek(offset)
+                    data = f.read(size)
+                    entries = [dyn.unpack_from(data, pos) for pos in range(0, len(data) - dyn.size + 1, dyn.size)]
+            strtab = next((file_offset(value) for tag, value in entries if tag == DT_STRTAB), None)
+            if strtab is None:
+                return interpreter, [], []
+            needed = []
+            run_path = []
+            for tag, value in entries:
+                if tag == DT_NULL:
+                    break
+                elif tag == DT_NEEDED:
+                    needed.append(string(strtab + value))
+                elif tag in (DT_RPATH, DT_RUNPATH):
+                    origin = os.path.dirname(os.path.realpath(path))
+                    run_path += [
+                        d.replace("$ORIGIN", origin).replace("${ORIGIN}", origin)
+                        for d in string(strtab + value).split(":") if d
+                    ]
+            return interpreter, needed, run_path
+    except (OSError, struct.error):
+        return None
+
+class Resolver:
+    # Finds all files needed to start given executables; results are shared across commands and threads
+
+    def __init__(self, lib_dirs: Optional[List[str]] = None):
+        self._lib_dirs = lib_dirs
+        self.seen = set()
+        self.libraries = {}     # (name, run path) -> path or None
+        self.lock = threading.Lock()
+
+    @property
+    def lib_dirs(self):
+        # read lazily, in a prefetch thread
+        with self.lock:
+            if self._lib_dirs is None:
+                self._lib_dirs = library_dirs()
+            return [*filter(None, os.environ.get("LD_LIBRARY_PATH", "").split(":")), *self._lib_dirs]
+
+    def find_library(self, name: str, run_path: List[str]):
+        if "/" in name:
+            return name if os.path.isfile(name) else None
+        key = (name, tuple(run_path))
+        if key not in self.libraries:
+            self.libraries[key] = next(
+                (
+                    os.path.join(d, name)
+                    for d in [*run_path, *self.lib_dirs]
+                    if os.path.isfile(os.path.join(d, name))
+                ),
+                None
+            )
+        return self.libraries[key]
+
+    def _claim(self, path: str):
+        # True for the first caller asking for the path
+        with self.lock:
+            if path in self.seen:
+                return False
+            self.seen.add(path)
+            return True
+
+    def files(self, executables: List[str]):
+        # Yields new files (not yielded before) as soon as they are found, in the order they are needed
+        stack = [(path, 0) for path in reversed(executables)]
+        while stack:
+            path, depth = stack.pop()
+            path = os.path.realpath(path)
+            if not self._claim(path):
+                continue
+            yield path
+            interpreter = shebang_interpreter(path)
+            if interpreter is not None:
+                if depth < MAX_SHEBANG_DEPTH:
+                    stack.append((interpreter, depth + 1))
+                continue
+            elf = read_elf(path)
+            if elf is None:
+                continue
+            loader, needed, run_path = elf
+            dependencies = [loader] if loader is not None else []
+            dependencies += filter(None, map(lambda name: self.find_library(name, run_path), needed))
+            stack.extend((dependency, depth) for dependency in reversed(dependencies))
+
+def expand_path(path: str):
+    if os.path.isdir(path):
+        for directory, _, names in os.walk(path):
+            for name in sorted(names):
+                yield os.path.join(directory, name)
+    elif os.path.isfile(path):
+        yield path
+
+def fadvise(path: str):
+    # Asks the kernel to read the file in background, returns its size (0 when it can't be opened)
+    try:
+        fd = os.open(path, os.O_RDONLY | os.O_CLOEXEC)
+    except OSError:
+        return 0
+    try:
+        size = os.fstat(fd).st_size
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+        return size
+    except OSError:
+        return 0
+    finally:
+        os.close(fd)
+
+class Prefetcher:
+    # Everything runs in the thread pool: each command and extra path is resolved by its own task, which
+    # submits fadvise for every file as soon as it finds it. start() doesn't wait for any I/O.
+
+    def __init__(
+        self,
+        extra_paths: List[str] = (),
+        workers: int = 8,
+        resolver: Optional[Resolver] = None,
+        out = sys.stderr,
+    ):
+        self.extra_paths = list(extra_paths)
+        self.workers = workers
+        self.resolver = resolver if resolver is not None else Resolver()
+        self.out = out
+        self.pool = None
+        self.resolving = []     # futures of the resolving tasks, their results are their finishing times
+        self.fetching = []      # futures of fadvise calls, their results are file sizes
+        self.started_at = None
+
+    def _fetch_all(self, paths):
+        for path in paths:
+            self.fetching.append(self.pool.submit(fadvise, path))
+        return time.monotonic()
+
+    def _resolve(self, cmd: Command):
+        return self._fetch_all(self.resolver.files(command_executables(cmd)))
+
+    def start(self, commands: List[Command]):
+        # Submits resolving of the commands (in their order) and of the extra paths, returns immediately
+        self.started_at = time.monotonic()
+        self.pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="prefetch")
+        self.resolving += [self.pool.submit(self._resolve, cmd) for cmd in commands]
+        self.resolving += [self.pool.submit(self._fetch_all, expand_path(extra)) for extra in self.extra_paths]
+
+    def finish(self):
+        # Waits until all files are submitted to the kernel and reports timings
+        if self.pool is None:
+            return
+        # resolving tasks submit more work, so the pool can be shut down only after they are done
+        resolved_at = max((future.result() for future in self.resolving), default=self.started_at)
+        self.pool.shutdown(wait=True)
+        sizes = [future.result() for future in self.fetching]
+        total = time.monotonic() - self.started_at
+        print(
+            f"Prefetched {len(sizes)} files ({sum(sizes) / 2**20:.1f} MiB) in {total * 1000:.0f} ms "
+            f"(resolved in {(resolved_at - self.started_at) * 1000:.0f} ms)",
+            file=self.out,
+        )
+        self.pool = None
+        self.resolving = []
+        self.fetching = []
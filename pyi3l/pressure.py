@@ -0,0 +1,135 @@
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional
+
+# Launch throttling based on Linux pressure stall information (PSI), see
+# https://docs.kernel.org/accounting/psi.html
+#
+# Before each launch, the runner asks Throttle.wait(), which holds back while the pressure of some resource
+# exceeds its threshold. PSI can notify about rising pressure, but not about it dropping, so we re-check it
+# every interval while holding back.
+
+log = logging.getLogger(__name__)
+
+RESOURCES = ["memory", "io", "cpu"]
+
+def parse_psi(text: str):
+    # "some avg10=1.00 avg60=0.50 avg300=0.10 total=12345" -> {"some": {"avg10": 1.0, …, "total": 12345.0}}
+    result = {}
+    for line in text.splitlines():
+        kind, *fields = line.split()
+        result[kind] = {k: float(v) for k, v in map(lambda f: f.split("=", 1), fields)}
+    return result
+
+class PsiSource:
+    # Reads the "some" pressure of each resource in percent.
+    # Pressure is computed from the stall time accumulated since a sample at least window seconds old, so it
+    # reacts much faster than the kernel's averages. Over just a few ms (launches follow each other closely) the
+    # value would be noise, so until we have such a sample, we fall back to the kernel's 10 s average.
+    # Any object with a compatible read() can be used instead, e.g. a fake for testing.
+
+    def __init__(self, root: str = "/proc/pressure", clock = time.monotonic, window: float = 1.0):
+        self.root = root
+        self.clock = clock
+        self.window = window
+        self.samples = {}   # resource -> deque of (time, total stall in µs), oldest first
+
+    def read(self) -> Dict[str, float]:
+        readings = {}
+        now = self.clock()
+        for resource in RESOURCES:
+            try:
+                with open(os.path.join(self.root, resource)) as f:
+                    some = parse_psi(f.read())["some"]
+            except (FileNotFoundError, KeyError):
+                continue    # older kernels, or PSI disabled
+            samples = self.samples.setdefault(resource, deque())
+            # keep just the newest sample that is old enough, and the younger ones
+            while len(samples) >= 2 and now - samples[1][0] >= self.window:
+                samples.popleft()
+            if samples and now - samples[0][0] >= self.window:
+                then, total = samples[0]
+                readings[resource] = (some["total"] - total) / ((now - then) * 1e6) * 100
+            else:
+                readings[resource] = some["avg10"]
+            samples.append((now, some["total"]))
+        return readings
+
+class Throttle:
+    def __init__(
+        self,
+        thresholds: Dict[str, float],
+        source = None,
+        interval: float = 0.25,
+        max_wait: Optional[float] = None,
+        settle: float = 0.1,
+        near: float = 0.5,
+        sleep = time.sleep,
+        clock = time.monotonic,
+    ):
+        # thresholds: resource ("memory", "io", "cpu") -> max pressure in percent
+        # settle: time given to the previous launch to show up in the pressure before checking it again, used
+        # only when the last reading was close to a threshold (above near × threshold), so that launches on an
+        # idle system aren't slowed down
+        self.thresholds = thresholds
+        self.source = source if source is not None else PsiSource(clock=clock, window=max(interval, 1.0))
+        self.interval = interval
+        self.max_wait = max_wait
+        self.settle = settle
+        self.near = near
+        self.sleep = sleep
+        self.clock = clock
+        self.released_at = None     # when the previous wait() returned, i.e. the previous launch
+        self.readings = {}          # the last readings of the source
+        # one Throttle can be shared by threads (e.g. sessions of pyi3l.daemon), the source and our state aren't
+        # thread-safe, so waits are serialized; the pressure is system-wide anyway
+        self.lock = threading.Lock()
+
+    def exceeded(self):
+        self.readings = self.source.read()
+        return {
+            resource: value
+            for resource, value in self.readings.items()
+            if resource in self.thresholds and value > self.thresholds[resource]
+        }
+
+    def is_near(self):
+        return any(
+            value > self.near * self.thresholds[resource]
+            for resource, value in self.readings.items()
+            if resource in self.thresholds
+        )
+
+    def wait(self, what: str = "launch"):
+        # Blocks while pressure exceeds the thresholds, returns the number of seconds spent waiting
+        with self.lock:
+            return self._wait(what)
+
+    def _wait(self, what: str):
+        start = self.clock()
+        if self.released_at is not None and start - self.released_at < self.settle and self.is_near():
+            self.sleep(self.settle - (start - self.released_at))
+        reported = None
+        while True:
+            exceeded = self.exceeded()
+            waited = self.clock() - start
+            if not exceeded:
+                if reported is not None:
+                    log.info("Pressure dropped after %.1fs, resuming with %s", waited, what)
+                self.released_at = self.clock()
+                return waited
+            if self.max_wait is not None and waited >= self.max_wait:
+                log.warning("Pressure still high after %.1fs, proceeding with %s anyway", waited, what)
+                self.released_at = self.clock()
+                return waited
+            if set(exceeded) != reported:
+                reported = set(exceeded)
+                log.info(
+                    "Holding back %s: %s",
+                    what,
+                    ", ".join(f"{r} {v:.1f}% > {self.thresholds[r]:g}%" for r, v in sorted(exceeded.items())),
+                )
+            self.sleep(self.interval)
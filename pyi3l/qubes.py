@@ -1,16 +1,52 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, replace
 from typing import Union, Optional
+import shlex
+import subprocess
 
-from pyi3l.tree import Command, WindowContent, SystemCommand, Window, Swallow, CmdModifier
+from pyi3l.tree import Command, WindowContent, Swallow, CmdModifier
 from pyi3l.patterns import Pattern, Literal, Anything
 
+@dataclass
+class QubeCommand(Command):
+    qube: str
+    command: Command
+
+    def run(self):
+        subprocess.run(self.to_system_command())
+
+    def to_shell_command(self):
+        return " ".join(map(shlex.quote, self.to_system_command()))
+
+    def to_system_command(self):
+        return [
+            "qvm-run",
+            self.qube,
+            "--",
+            self.command.to_shell_command()
+        ]
+
+    def coalesce_key(self):
+        key = self.command.coalesce_key()
+        return None if key is None else ("qvm-run", self.qube, key)
+
+    def coalesce(self, others):
+        return QubeCommand(self.qube, self.command.coalesce([o.command for o in others]))
+
+    def with_window_key(self, key: str):
+        adjusted = self.command.with_window_key(key)
+        if adjusted is None:
+            return None
+        cmd, swallow = adjusted
+        return QubeCommand(self.qube, cmd), Qube(self.qube).adjust_swallow(swallow)
+
 @dataclass
 class Qube(CmdModifier):
     name: str
     unicode_titles: bool = False
 
     def adjust_content(self, content: WindowContent):
-        return WindowContent(
+        return replace(
+            content,
             swallows = list(map(self.adjust_swallow, content.swallows)),
             default_name = f"{self.name} » {content.default_name or '???'}",
             commands = list(map(
@@ -41,12 +77,7 @@ class Qube(CmdModifier):
         )
         
     def adjust_command(self, command: Command):
-        return SystemCommand([
-            "qvm-run",
-            self.name,
-            "--",
-            command.to_shell_command()
-        ])
+        return QubeCommand(self.name, command)
 
     def _adjust_title(self, title: Optional[Pattern]):
         if title is None:
@@ -1,5 +1,9 @@
 import ast
-from dataclasses import is_dataclass
+import io
+import re
+from collections import Counter
+from dataclasses import dataclass, is_dataclass
+from functools import lru_cache
 from itertools import takewhile, dropwhile
 from typing import Union, get_origin, get_args
 
@@ -26,7 +30,12 @@ def suitable_for_positional_arg(kv):
 	return not is_optional_type(f.type)
 
 def split_args(o):
-	fields = o.__dataclass_fields__.items()
+	return _split_fields(type(o))
+
+@lru_cache(maxsize=None)
+def _split_fields(cls):
+	# typing introspection is slow, and the result depends only on the class
+	fields = cls.__dataclass_fields__.items()
 	if len(fields) == 1:
 		args = fields
 		kwargs = []
@@ -53,30 +62,213 @@ def astize_dataclass(o):
 		],
 	)
 
-def pythonize(o):
-	return ast.unparse(astize(o))
-
-def pythonize_full(o):
-	return "#!/usr/bin/python\n" + ast.unparse(
-		ast.Module(
-			body=[
-				ast.ImportFrom(
-					module='pyi3l',
-					names=[ast.alias(name='*')],
-				),
-				ast.ImportFrom(
-					module='pyi3l.cmd',
-					names=[ast.alias(name='apply')],
-				),
-				ast.Expr(
-					ast.Call(
-						func=ast.Name(id='apply'),
-						args=[astize(o)],
-						keywords=[],
-					)
-				)
+LINE_LENGTH = 120
+INDENT = "    "
+
+@dataclass
+class _Ref:
+	# reference to a hoisted subtree
+	name: str
+
+@dataclass
+class _Node:
+	# already decomposed compound value, see children
+	opener: str
+	closer: str
+	items: list
+
+def literal(o):
+	if isinstance(o, _Ref):
+		return o.name
+	if isinstance(o, str):
+		r = repr(o)
+		if r.startswith("'") and '"' not in o:
+			# prefer double quotes, like black does
+			return '"' + r[1:-1].replace("\\'", "'") + '"'
+		return r
+	return repr(o)
 
+def children(o):
+	# Returns (opener, closer, [(prefix, child), ...]) for compound values, None for scalars
+	if isinstance(o, _Node):
+		return o.opener, o.closer, o.items
+	if isinstance(o, _Ref):
+		return None
+	if isinstance(o, list):
+		return "[", "]", [("", i) for i in o]
+	if isinstance(o, dict):
+		return "{", "}", [(literal(k) + ": ", v) for k, v in o.items()]
+	if is_dataclass(o):
+		args, kwargs = split_args(o)
+		return o.__class__.__name__ + "(", ")", [
+			*[("", getattr(o, k)) for k, v in args],
+			*[
+				(k + "=", getattr(o, k))
+				for k, v in kwargs
+				if v.default != getattr(o, k)
 			],
-			type_ignores=[],
-		)
+		]
+	if isinstance(o, float) or isinstance(o, int) or isinstance(o, str) or o is None:
+		return None
+	raise ValueError(f"unsupported {o}")
+
+@dataclass
+class _Laid:
+	# compound value decomposed just once, with the width of its single-line form, see lay_out
+	opener: str
+	closer: str
+	items: list     # [(prefix, _Laid or literal string of a scalar)]
+	width: int
+
+def lay_out(o):
+	c = children(o)
+	if c is None:
+		return literal(o)
+	opener, closer, items = c
+	laid = [(prefix, lay_out(child)) for prefix, child in items]
+	width = len(opener) + len(closer) + 2 * max(len(laid) - 1, 0) + sum(
+		len(prefix) + (len(child) if isinstance(child, str) else child.width)
+		for prefix, child in laid
 	)
+	return _Laid(opener, closer, laid, width)
+
+def flat(laid):
+	# Single-line form of a value prepared by lay_out
+	if isinstance(laid, str):
+		return laid
+	return laid.opener + ", ".join(prefix + flat(child) for prefix, child in laid.items) + laid.closer
+
+class Emitter:
+	# Writes black-like formatted Python code to a stream, line by line, while walking the tree
+
+	def __init__(self, out, line_length: int = LINE_LENGTH):
+		self.out = out
+		self.line_length = line_length
+
+	def emit(self, o, level: int = 0, prefix: str = "", suffix: str = ""):
+		self._emit(lay_out(o), level, prefix, suffix)
+
+	def _emit(self, laid, level: int, prefix: str, suffix: str):
+		indent = INDENT * level
+		budget = self.line_length - len(indent) - len(prefix) - len(suffix)
+		if isinstance(laid, str) or laid.width <= budget:
+			# scalars cannot be wrapped
+			self.out.write(f"{indent}{prefix}{flat(laid)}{suffix}\n")
+		else:
+			self.out.write(f"{indent}{prefix}{laid.opener}\n")
+			for child_prefix, child in laid.items:
+				self._emit(child, level + 1, child_prefix, ",")
+			self.out.write(f"{indent}{laid.closer}{suffix}\n")
+
+def write_python(o, out, line_length: int = LINE_LENGTH):
+	Emitter(out, line_length).emit(o)
+
+def pythonize(o, line_length: int = LINE_LENGTH):
+	out = io.StringIO()
+	write_python(o, out, line_length)
+	return out.getvalue().rstrip("\n")
+
+MIN_HOISTED_SIZE = 4  # nodes; smaller repeated subtrees, like Literal("x"), are cheaper to repeat
+
+class CommonSubtrees:
+	# Finds repeated subtrees (e.g. identical swallows or window contents), so they can be written just once.
+	#
+	# The first pass hash-conses the tree: structurally equal subtrees get the same id, computed from the ids of
+	# their children, so the pass is linear. The second pass counts uses of repeated subtrees, but doesn't
+	# descend into a repeated subtree again, so parts repeated only inside a hoisted subtree aren't hoisted.
+
+	def __init__(self, o):
+		self.ids = {}       # structural key -> id
+		self.nodes = []     # id -> (value, opener, closer, [(prefix, child id)]); opener is None for scalars
+		self.sizes = []
+		self.counts = Counter()
+		self.root = self._intern(o)
+		self.names = {}     # hoisted id -> variable name
+		self.order = []     # hoisted ids, each one after all hoisted ids it refers to
+		self._hoist()
+
+	def _intern(self, o):
+		c = children(o)
+		if c is None:
+			key = (None, type(o).__name__, literal(o))
+			node = (o, None, None, None)
+			size = 1
+		else:
+			opener, closer, items = c
+			child_ids = tuple((prefix, self._intern(child)) for prefix, child in items)
+			key = (opener, closer, child_ids)
+			node = (o, opener, closer, child_ids)
+			size = 1 + sum(self.sizes[i] for _, i in child_ids)
+		nid = self.ids.get(key)
+		if nid is None:
+			nid = self.ids[key] = len(self.nodes)
+			self.nodes.append(node)
+			self.sizes.append(size)
+		self.counts[nid] += 1
+		return nid
+
+	def _candidate(self, nid):
+		return self.counts[nid] >= 2 and self.nodes[nid][1] is not None and self.sizes[nid] >= MIN_HOISTED_SIZE
+
+	def _hoist(self):
+		uses = Counter()
+		visited = set()
+		candidates = []
+		stack = [(self.root, False)]
+		while stack:
+			nid, done = stack.pop()
+			if done:
+				candidates.append(nid)
+				continue
+			if self._candidate(nid):
+				uses[nid] += 1
+				if nid in visited:
+					continue
+				visited.add(nid)
+				stack.append((nid, True))
+			stack.extend((child, False) for _, child in reversed(self.nodes[nid][3] or ()))
+		used_names = Counter()
+		for nid in candidates:
+			if uses[nid] >= 2 and nid != self.root:
+				base = self._base_name(nid)
+				used_names[base] += 1
+				self.names[nid] = f"{base}_{used_names[base]}"
+				self.order.append(nid)
+
+	def _base_name(self, nid):
+		o = self.nodes[nid][0]
+		if isinstance(o, list):
+			first = next((i for i in o if is_dataclass(i)), None)
+			return "items" if first is None else snake_case(first.__class__.__name__) + "s"
+		if isinstance(o, dict):
+			return "mapping"
+		return snake_case(o.__class__.__name__)
+
+	def build(self, nid, definition: bool = False):
+		# The subtree with hoisted parts replaced by references, ready for Emitter
+		if nid in self.names and not definition:
+			return _Ref(self.names[nid])
+		o, opener, closer, child_ids = self.nodes[nid]
+		if opener is None:
+			return o
+		return _Node(opener, closer, [(prefix, self.build(child)) for prefix, child in child_ids])
+
+def snake_case(name: str):
+	return re.sub(r"(?<!^)(?=[A-Z])", "_", name).lower()
+
+def write_full(o, out, line_length: int = LINE_LENGTH, extract_common: bool = True):
+	out.write("#!/usr/bin/python\nfrom pyi3l import *\nfrom pyi3l.cmd import apply\n\n")
+	emitter = Emitter(out, line_length)
+	if extract_common:
+		common = CommonSubtrees(o)
+		for nid in common.order:
+			emitter.emit(common.build(nid, definition=True), prefix=f"{common.names[nid]} = ")
+		if common.order:
+			out.write("\n")
+		o = common.build(common.root)
+	emitter.emit(o, prefix="apply(", suffix=")")
+
+def pythonize_full(o, line_length: int = LINE_LENGTH, extract_common: bool = True):
+	out = io.StringIO()
+	write_full(o, out, line_length, extract_common)
+	return out.getvalue()
@@ -0,0 +1,43 @@
+from pyi3l.tree import *
+from pyi3l.placeholders import windows_of
+
+# Export of windows as static i3 config rules (assign / for_window) instead of swallowing placeholders.
+#
+# A rule is cheaper for i3 than a placeholder, but it can only send the window to a workspace and mark it,
+# not place it into a particular spot of the layout. Use Window(…, placement="rule") for windows where this is
+# enough, or export all windows this way.
+
+def criteria(swallow: Swallow):
+    # Same regexes as in layouts, so Pattern.to_pcre is the single source of truth
+    return "[" + " ".join(
+        f'{key}="{quote(value)}"'
+        for key, value in swallow.to_json().items()
+    ) + "]"
+
+def quote(value: str):
+    return value.replace('"', '\\"')
+
+def window_rules(ws, window: Window):
+    lines = [f"# {window.name or window.content.default_name or '(unnamed window)'}"]
+    for swallow in optimize_swallows(window.content.swallows):
+        c = criteria(swallow)
+        if ws is not None:
+            lines.append(f"assign {c} workspace {ws}")
+        for mark in window.marks or []:
+            lines.append(f"for_window {c} mark --add {mark}")
+        if ws is None and not window.marks:
+            lines.append(f"# nothing to do for {c}, the window has neither a workspace nor marks")
+    return lines
+
+def rules(d, all_windows: bool = False):
+    # Rules for windows with placement="rule", or for all windows when all_windows is set
+    return "\n".join([
+        "# Generated by pyi3l, include this in your i3 config",
+        *[
+            line
+            for ws, toplevel in d.items()
+            for window in windows_of(toplevel)
+            if all_windows or window.placement == "rule"
+            for line in ["", *window_rules(ws, window)]
+        ],
+    ])
@@ -3,10 +3,96 @@ from dataclasses import dataclass, replace
 from .util import only_nonnone, remove_keys, noneize_defaults
 from .patterns import Pattern
 import json
-from typing import List, Optional, Union
+from typing import Dict, List, Optional, Union
+import os
+import re
 import subprocess
 import shlex
 from functools import partial
+from itertools import count
+import hashlib
+
+ENV_ASSIGNMENT = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*=")
+
+@dataclass
+class Invocation:
+    # Structured form of a command: what to exec, where and with which extra environment.
+    # It can be spawned directly (no shell, no env(1)) and lowered to a plain argv when crossing
+    # a boundary that needs one (qvm-run, terminal -x, Bash export).
+    argv: List[str]
+    cwd: Optional[str] = None
+    env: Optional[Dict[str, str]] = None
+
+    def within(self, cwd: Optional[str] = None, env: Optional[Dict[str, str]] = None):
+        # Merges an enclosing working directory and environment; the inner ones take precedence
+        return Invocation(
+            argv = self.argv,
+            cwd = cwd if self.cwd is None else (self.cwd if cwd is None else os.path.join(cwd, self.cwd)),
+            env = {**(env or {}), **(self.env or {})} or None,
+        )
+
+    def to_system_command(self):
+        if self.cwd is None and not self.env:
+            return self.argv
+        return [
+            "env",
+            *(["-C", self.cwd] if self.cwd is not None else []),
+            "--",
+            *map(lambda kv: f"{kv[0]}={kv[1]}", (self.env or {}).items()),
+            *self.argv,
+        ]
+
+    def to_shell_command(self):
+        return " ".join(map(shlex.quote, self.to_system_command()))
+
+    def popen_kwargs(self, extra_env: Optional[Dict[str, str]] = None):
+        env = {**(extra_env or {}), **(self.env or {})}
+        return dict(
+            cwd = self.cwd,
+            env = {**os.environ, **env} if env else None,
+        )
+
+    def run(self):
+        subprocess.run(self.argv, **self.popen_kwargs())
+
+    def spawn(self, extra_env: Optional[Dict[str, str]] = None):
+        # Starts the process in background, detached from our session, like `cmd &` in a script
+        return subprocess.Popen(
+            self.argv,
+            stdin = subprocess.DEVNULL,
+            start_new_session = True,
+            **self.popen_kwargs(extra_env),
+        )
+
+    @staticmethod
+    def from_system_command(argv: List[str]):
+        # Lifts leading `env [-C dir] [NAME=value…] [--]` wrappers into structured fields.
+        # Anything we don't understand is kept as a part of argv.
+        argv = list(argv)
+        if len(argv) == 0 or argv[0] != "env":
+            return Invocation(argv)
+        cwd = None
+        env = {}
+        i = 1
+        while i < len(argv) and argv[i].startswith("-") and argv[i] != "--":
+            if argv[i] == "-C" and i + 1 < len(argv):
+                cwd = argv[i + 1]
+                i += 2
+            elif argv[i].startswith("--chdir="):
+                cwd = argv[i][len("--chdir="):]
+                i += 1
+            else:
+                return Invocation(argv)
+        if i < len(argv) and argv[i] == "--":
+            i += 1
+        while i < len(argv) and ENV_ASSIGNMENT.match(argv[i]):
+            name, value = argv[i].split("=", 1)
+            env[name] = value
+            i += 1
+        if i == len(argv):
+            return Invocation(argv)
+        return Invocation.from_system_command(argv[i:]).within(cwd, env)
+
 
 class Command(ABC):
     @abstractmethod
@@ -19,6 +105,24 @@ class Command(ABC):
     def to_system_command(self):
         pass
 
+    def to_invocation(self):
+        return Invocation.from_system_command(self.to_system_command())
+
+    def coalesce_key(self):
+        # Commands with equal keys (other than None) can be merged by coalesce into a single process,
+        # typically an app that opens multiple windows, see coalesce_launches
+        return None
+
+    def coalesce(self, others: List["Command"]):
+        # Single command doing the job of self and all of others
+        raise NotImplementedError(f"{self} cannot be coalesced")
+
+    def with_window_key(self, key: str):
+        # For apps that can label their window (e.g. by a window role), returns (command, swallow) where the
+        # command opens a window labelled by key and the swallow matches exactly that label; None otherwise.
+        # See ExactKeys.
+        return None
+
 @dataclass
 class ShellCommand(Command):
     command: str
@@ -45,6 +149,72 @@ class SystemCommand(Command):
     def to_system_command(self):
         return self.command
 
+@dataclass
+class ModifiedCommand(Command):
+    # Command run in another working directory and/or with extra environment variables.
+    # Nested modifiers are merged into a single ModifiedCommand, see ModifiedCommand.of.
+    command: Command
+    cwd: Optional[str] = None
+    env: Optional[Dict[str, str]] = None
+
+    def run(self):
+        self.to_invocation().run()
+
+    def to_invocation(self):
+        return self.command.to_invocation().within(self.cwd, self.env)
+
+    def to_shell_command(self):
+        return self.to_invocation().to_shell_command()
+
+    def to_system_command(self):
+        return self.to_invocation().to_system_command()
+
+    def coalesce_key(self):
+        key = self.command.coalesce_key()
+        if key is None:
+            return None
+        return ("env", self.cwd, tuple(sorted((self.env or {}).items())), key)
+
+    def coalesce(self, others: List[Command]):
+        return ModifiedCommand(self.command.coalesce([o.command for o in others]), self.cwd, self.env)
+
+    def with_window_key(self, key: str):
+        adjusted = self.command.with_window_key(key)
+        if adjusted is None:
+            return None
+        cmd, swallow = adjusted
+        return ModifiedCommand(cmd, self.cwd, self.env), swallow
+
+    @staticmethod
+    def of(command: Command, cwd: Optional[str] = None, env: Optional[Dict[str, str]] = None):
+        if isinstance(command, ModifiedCommand):
+            merged = Invocation([], command.cwd, command.env).within(cwd, env)
+            return ModifiedCommand(command.command, merged.cwd, merged.env)
+        else:
+            return ModifiedCommand(command, cwd, env)
+
+def coalesce_launches(launches):
+    # Turns [(window, command)] into [([windows], command)], merging commands with equal coalesce keys.
+    # A merged command takes the position of its first part.
+    groups = {}
+    result = []
+    for window, cmd in launches:
+        key = cmd.coalesce_key()
+        if key is not None and key in groups:
+            groups[key].append((window, cmd))
+        else:
+            group = [(window, cmd)]
+            result.append(group)
+            if key is not None:
+                groups[key] = group
+    return [
+        (
+            [window for window, _ in group],
+            group[0][1] if len(group) == 1 else group[0][1].coalesce([cmd for _, cmd in group[1:]]),
+        )
+        for group in result
+    ]
+
 @dataclass
 class PartialSystemCommand:
     command: List[str]
@@ -62,12 +232,24 @@ class Element(ABC):
     def to_commands(self):
         pass
 
+    def to_launches(self):
+        # Commands paired with the Window they are supposed to fill (None when unknown)
+        return [(None, cmd) for cmd in self.to_commands()]
+
     @abstractmethod
     def without_marks(self): pass
 
     @abstractmethod
     def map_windows(self, f): pass
 
+    def filter_windows(self, keep):
+        # The element with just the windows for which keep(window) is true, None if nothing remains
+        return self
+
+    def without_rules(self):
+        # The part of the element realized by placeholders (see Window.placement), None if nothing remains
+        return self.filter_windows(lambda window: window.placement != "rule")
+
 class Toplevel(Element):
     @abstractmethod
     def to_layout_string(self, indent = None):
@@ -125,6 +307,13 @@ class Multi(Toplevel):
             for cmd in e.to_commands()
         ]
 
+    def to_launches(self):
+        return [
+            launch
+            for e in self.elements
+            for launch in e.to_launches()
+        ]
+
     def to_layout_string(self, indent = None):
         l = self.to_layout()
         return "\n\n".join(map(lambda e: json.dumps(e, indent=indent), l))
@@ -135,6 +324,10 @@ class Multi(Toplevel):
     def without_marks(self):
         return Multi(elements=list(map(lambda el: el.without_marks(), self.elements)))
 
+    def filter_windows(self, keep):
+        elements = [el for el in map(lambda el: el.filter_windows(keep), self.elements) if el is not None]
+        return Multi(elements=elements) if elements else None
+
     @staticmethod
     def import_multi(l):
         return Multi(list(map(Node.import_node, l)))
@@ -162,6 +355,33 @@ class Swallow:
             "window_role": re(self.window_role),
         })
 
+    def covers(self, other: "Swallow"):
+        # True if every window matched by other is matched by self, too
+        return all(
+            mine is None or (theirs is not None and mine.covers(theirs))
+            for mine, theirs in zip(self._attributes(), other._attributes())
+        )
+
+    def merge(self, other: "Swallow"):
+        # Merges swallows differing in just one attribute into a single one with alternation, None otherwise
+        differing = [
+            i
+            for i, (mine, theirs) in enumerate(zip(self._attributes(), other._attributes()))
+            if mine != theirs
+        ]
+        if len(differing) != 1:
+            return None
+        i = differing[0]
+        mine, theirs = self._attributes()[i], other._attributes()[i]
+        if mine is None or theirs is None:
+            return None
+        attributes = self._attributes()
+        attributes[i] = mine | theirs
+        return Swallow(*attributes)
+
+    def _attributes(self):
+        return [self.win_class, self.instance, self.machine, self.title, self.window_role]
+
     @staticmethod
     def import_swallow(j):
         return Swallow(
@@ -172,6 +392,31 @@ class Swallow:
             window_role = Pattern.import_pattern(j.get("window_role")),
         )
 
+def optimize_swallows(swallows: List[Swallow]):
+    # Every swallow is another criteria match i3 runs for each new window, so we drop duplicates and swallows
+    # covered by broader ones, and merge swallows that differ in a single attribute.
+    def without_covered(swallows):
+        result = []
+        for sw in swallows:
+            if not any(map(lambda r: r.covers(sw), result)):
+                result = [r for r in result if not sw.covers(r)] + [sw]
+        return result
+
+    result = without_covered(swallows)
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(result)):
+            for j in range(i + 1, len(result)):
+                m = result[i].merge(result[j])
+                if m is not None:
+                    result = without_covered([*result[:i], m, *result[i+1:j], *result[j+1:]])
+                    merged = True
+                    break
+            if merged:
+                break
+    return result
+
 @dataclass
 class Geometry:
     x: Optional[int] = None
@@ -212,6 +457,8 @@ class WindowContent:
     default_name: Optional[str] = None
     commands: Optional[List[Command]] = None
     flatpak_ids: Optional[List[str]] = None
+    # seconds to wait for the window before its placeholder is considered stale, see pyi3l.placeholders
+    timeout: Optional[float] = None
 
     def as_flatpak(self):
         return replace(
@@ -232,6 +479,8 @@ class WindowContent:
             swallows = list(map(Swallow.import_swallow, j.get("swallows"))),
         )
 
+PLACEMENTS = ("placeholder", "rule")
+
 @dataclass
 class Window(Node):
     content: WindowContent
@@ -245,17 +494,30 @@ class Window(Node):
     geometry: Optional[Geometry] = None
 
     others: Optional[dict] = None
+    # "placeholder" (swallowed by a placeholder from append_layout) or "rule" (placed by static i3 config
+    # rules, see pyi3l.rules)
+    placement: str = "placeholder"
+
+    def __post_init__(self):
+        if self.placement not in PLACEMENTS:
+            raise ValueError(f"Unknown placement {self.placement!r}, expected one of {', '.join(PLACEMENTS)}")
 
     def to_commands(self):
         return self.content.commands or []
 
+    def filter_windows(self, keep):
+        return self if keep(self) else None
+
+    def to_launches(self):
+        return [(self, cmd) for cmd in self.to_commands()]
+
     def to_layout(self):
         return {
             **only_nonnone({
                 "name": self.name or self.content.default_name,
                 "percent": self.percent,
                 "marks": self.marks,
-                "swallows": list(map(lambda sw: sw.to_json(), self.content.swallows)),
+                "swallows": list(map(lambda sw: sw.to_json(), optimize_swallows(self.content.swallows))),
                 "border": self.border,
                 "current_border_width": self.current_border_width,
                 "floating": self.floating,
@@ -355,6 +617,13 @@ class Layout(Node):
             for cmd in e.to_commands()
         ]
 
+    def to_launches(self):
+        return [
+            launch
+            for e in self.nodes
+            for launch in e.to_launches()
+        ]
+
     def map_windows(self, f):
         return self.map_nodes(lambda el: el.map_windows(f))
 
@@ -367,6 +636,10 @@ class Layout(Node):
             nodes=list(map(f, self.nodes)),
         )
 
+    def filter_windows(self, keep):
+        nodes = [el for el in map(lambda el: el.filter_windows(keep), self.nodes) if el is not None]
+        return replace(self, nodes=nodes) if nodes else None
+
 FloatingLayout = partial(Layout, type="floating_con")
 
 Horizontal = partial(Layout, "splith")
@@ -380,6 +653,33 @@ FloatingTabbed = partial(FloatingLayout, "tabbed")
 FloatingStacked = partial(FloatingLayout, "stacked")
 
 
+class ExactKeys:
+    # Window mapper (for map_windows) replacing regex-based swallows by an exact generated label, for apps
+    # supporting it (see Command.with_window_key). Comparing a literal is cheap for i3, and identical apps
+    # launched in parallel can no longer swap places. Windows of other apps are left untouched.
+    #
+    # Keys are deterministic (a counter plus a digest of the command), so exports stay stable between runs.
+    # Use a single instance for the whole layout dict, so that the keys are unique.
+
+    def __init__(self, prefix: str = "pyi3l"):
+        self.prefix = prefix
+        self.counter = count()
+
+    def __call__(self, window: "Window"):
+        return window.map_content(self.adjust_content)
+
+    def adjust_content(self, content: "WindowContent"):
+        if content.commands is None or len(content.commands) != 1:
+            return content
+        cmd = content.commands[0]
+        digest = hashlib.sha1(repr(cmd).encode("utf-8")).hexdigest()[:8]
+        adjusted = cmd.with_window_key(f"{self.prefix}-{next(self.counter)}-{digest}")
+        if adjusted is None:
+            return content
+        cmd, swallow = adjusted
+        return replace(content, commands=[cmd], swallows=[swallow])
+
+
 class CmdModifier(ABC):
 
     def __call__(self, arg: Union[WindowContent, Command, Window]):
@@ -398,12 +698,10 @@ class CmdModifier(ABC):
     def adjust_command(self, command: Command): pass
 
     def adjust_content(self, content: WindowContent):
-        return WindowContent(
-            swallows = content.swallows,
-            default_name = content.default_name,
+        return replace(
+            content,
             commands = list(map(
                 self.adjust_command,
                 content.commands or []
             )),
-            flatpak_ids = content.flatpak_ids,
         )
@@ -1,3 +1,7 @@
+import hashlib
+import json
+import os
+
 def pcre_quote(s: str):
     return "".join(map(
         lambda c: f"\\{c}" if c in ".^$*+?()[{\\|" else c,
@@ -19,3 +23,38 @@ def noneize_defaults(o, default):
         return None
     else:
         return o
+
+def content_hash(data: bytes):
+    return hashlib.sha256(data).hexdigest()
+
+def write_if_changed(path: str, content: str, mode: int = 0o644):
+    # Returns True if the file was (re)written
+    data = content.encode("utf-8")
+    try:
+        with open(path, "rb") as f:
+            if content_hash(f.read()) == content_hash(data):
+                return False
+    except FileNotFoundError:
+        pass
+    with open(path, "wb") as f:
+        f.write(data)
+    os.chmod(path, mode)
+    return True
+
+def read_layout_file(path: str):
+    with open(path) as f:
+        return parse_layout(f.read())
+
+def parse_layout(text: str):
+    # append_layout files may contain several JSON objects, i3-save-tree style comments are ignored
+    text = "\n".join(line for line in text.splitlines() if not line.strip().startswith("//"))
+    decoder = json.JSONDecoder()
+    objs = []
+    pos = 0
+    while True:
+        while pos < len(text) and text[pos].isspace():
+            pos += 1
+        if pos == len(text):
+            return objs
+        obj, pos = decoder.raw_decode(text, pos)
+        objs.extend(obj if isinstance(obj, list) else [obj])
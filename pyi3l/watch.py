@@ -0,0 +1,256 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import time
+import traceback
+from collections import Counter
+from typing import Optional
+
+from dataclasses import replace
+
+from pyi3l.tree import Window
+from pyi3l.exec import spawn, try_launch, use_layout
+from pyi3l.ipc import Connection, iter_cons, report_failures
+from pyi3l.placeholders import generated_mark, mark_windows, unmark_command, windows_of, without_generated_marks
+
+# Watch mode: re-applies a layout script whenever it's saved, pushing only what has changed.
+#
+# Windows are compared one by one: placeholders are appended and commands launched only for added windows,
+# placeholders of removed windows are killed (found by their generated marks) unless already filled. Windows
+# of the same app whose layout attributes changed are re-placed while their placeholder is unfilled.
+#
+# The script is re-run in this (already warm) interpreter. Modules it imports are cached in sys.modules,
+# so changes in them are not picked up; restart the watch for that.
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+INOTIFY_EVENT = struct.Struct("iIII")   # wd, mask, cookie, len; followed by len bytes of name
+
+DEBOUNCE = 0.05     # editors often write a file in several steps
+
+class FileWatcher:
+    # Waits for changes of a single file via inotify. We watch the directory rather than the file, because
+    # many editors save by writing a new file and renaming it over the original one.
+
+    def __init__(self, path: str):
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        directory, self.name = os.path.split(os.path.abspath(path))
+        if self.libc.inotify_add_watch(self.fd, directory.encode(), IN_CLOSE_WRITE | IN_MOVED_TO) < 0:
+            raise OSError(ctypes.get_errno(), f"Cannot watch {directory}")
+
+    def close(self):
+        os.close(self.fd)
+
+    def _changed(self, data: bytes):
+        pos = 0
+        while pos < len(data):
+            wd, mask, cookie, length = INOTIFY_EVENT.unpack_from(data, pos)
+            pos += INOTIFY_EVENT.size
+            name = data[pos:pos + length].rstrip(b"\0").decode(errors="replace")
+            pos += length
+            if name == self.name:
+                return True
+        return False
+
+    def wait(self, timeout: Optional[float] = None):
+        # Blocks until the file is changed, returns False on timeout
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            remaining = None if deadline is None else max(deadline - time.monotonic(), 0)
+            readable, _, _ = select.select([self.fd], [], [], remaining)
+            if not readable:
+                return False
+            if self._changed(os.read(self.fd, 65536)):
+                # swallow the rest of a burst of writes
+                while select.select([self.fd], [], [], DEBOUNCE)[0]:
+                    os.read(self.fd, 65536)
+                return True
+
+def window_key(ws, window: Window):
+    # Windows equal in everything but the generated mark
+    return ws, repr(without_generated_marks(window))
+
+def content_key(window: Window):
+    # Windows showing the same app (swallows and commands), regardless of where they are in the layout
+    return repr(window.content)
+
+def all_marks(d):
+    return {
+        mark
+        for toplevel in d.values()
+        for mark in map(generated_mark, windows_of(toplevel))
+        if mark is not None
+    }
+
+def diff_windows(old, new):
+    # Matches windows of the freshly loaded dict new to windows of the applied (marked) dict old: identical
+    # windows first, then the rest by their content, identical ones are counted. Matched windows keep the mark
+    # of their old counterpart, so their commands aren't launched again.
+    # Returns (new with generated marks, marks of added windows, marks of removed windows, marks of windows
+    # matched by content only, i.e. with changed layout attributes like percent, name or workspace).
+    by_window = {}
+    by_content = {}
+    for ws, toplevel in old.items():
+        for window in windows_of(toplevel):
+            by_window.setdefault(window_key(ws, window), []).append(generated_mark(window))
+            by_content.setdefault(content_key(window), []).append(generated_mark(window))
+    used = set()
+    def take(candidates):
+        while candidates:
+            mark = candidates.pop(0)
+            if mark not in used:
+                used.add(mark)
+                return mark
+        return None
+    def carry_over(candidates):
+        def f(window: Window):
+            if generated_mark(window) is not None:
+                return window
+            mark = take(candidates(window))
+            return window if mark is None else replace(window, marks=[*(window.marks or []), mark])
+        return f
+    new = {
+        ws: toplevel.map_windows(carry_over(lambda window, ws=ws: by_window.get(window_key(ws, window), [])))
+        for ws, toplevel in new.items()
+    }
+    matched = used.copy()
+    new = {
+        ws: toplevel.map_windows(carry_over(lambda window: by_content.get(content_key(window), [])))
+        for ws, toplevel in new.items()
+    }
+    changed = used - matched
+    new = mark_windows(new)
+    old_marks = all_marks(old)
+    new_marks = all_marks(new)
+    return new, new_marks - old_marks, old_marks - new_marks, changed
+
+def command_key(cmd):
+    return repr(cmd)
+
+def new_launches(old, new, added):
+    # Launches of added windows, plus commands not bound to a window that weren't in old (identical ones counted)
+    remaining = Counter(
+        command_key(cmd)
+        for toplevel in old.values()
+        for window, cmd in toplevel.to_launches()
+        if window is None
+    )
+    launches = []
+    for toplevel in new.values():
+        for window, cmd in toplevel.to_launches():
+            if window is not None:
+                if generated_mark(window) in added:
+                    launches.append((window, cmd))
+                continue
+            key = command_key(cmd)
+            if remaining[key] > 0:
+                remaining[key] -= 1
+            else:
+                launches.append((window, cmd))
+    return launches
+
+def window_name(window: Window):
+    return window.name or window.content.default_name or generated_mark(window)
+
+def update(
+    connection: Connection,
+    old,
+    new,
+    added,
+    removed,
+    changed,
+    workspace_switching: bool = True,
+    out = sys.stderr,
+):
+    # Kills unfilled placeholders of removed windows and appends placeholders for added ones. Placeholders
+    # filled already are real windows now, we just take our generated marks away from them.
+    # A changed window is re-placed if its placeholder is still unfilled (its app is on its way, no need to
+    # launch it again), otherwise it's left where it is and reported.
+    marks = all_marks(old)
+    commands = []
+    unfilled = set()
+    for con in iter_cons(connection.get_tree()):
+        for mark in con.get("marks") or []:
+            if con.get("window") is None and (mark in removed or mark in changed):
+                commands.append(f"[con_id={con['id']}] kill")
+                unfilled.add(mark)
+            elif con.get("window") is not None and mark in marks:
+                commands.append(unmark_command([mark]))
+    if commands:
+        report_failures(connection.command(";".join(commands)))
+    placing = added | (changed & unfilled)
+    for ws, toplevel in new.items():
+        for window in windows_of(toplevel):
+            if generated_mark(window) in changed - unfilled and window.placement != "rule":
+                print(
+                    f"{window_name(window)} changed on workspace {ws}, but it's already open, leaving it as it is",
+                    file=out,
+                )
+        placeholders = toplevel.filter_windows(
+            lambda w: w.placement != "rule" and generated_mark(w) in placing
+        )
+        if placeholders is not None:
+            use_layout(ws, placeholders, workspace_switching=workspace_switching, connection=connection)
+
+def watch(
+    path: str,
+    d,
+    transform = None,
+    commands: bool = True,
+    layout: bool = True,
+    workspace_switching: bool = True,
+    socket_path: Optional[str] = None,
+    launch = spawn,
+    out = sys.stderr,
+):
+    # d is the dict that has already been applied, with generated marks (see pyi3l.placeholders.mark_windows)
+    # left on its unfilled placeholders. transform(d) rewrites each reloaded dict the same way apply did
+    # (see pyi3l.cmd.transform_layouts).
+    from pyi3l.cmd import load_layouts
+    watcher = FileWatcher(path)
+    print(f"Watching {path}", file=out)
+    try:
+        while True:
+            watcher.wait()
+            start = time.monotonic()
+            try:
+                new = load_layouts(path)
+                if transform is not None:
+                    new = transform(new)
+            except Exception:
+                traceback.print_exc(file=out)
+                continue
+            new, added, removed, changed = diff_windows(d, new)
+            launches = new_launches(d, new, added) if commands else []
+            if layout and (added or removed or changed):
+                with Connection(socket_path) as connection:
+                    update(
+                        connection, d, new, added, removed, changed,
+                        workspace_switching=workspace_switching, out=out,
+                    )
+            for window, cmd in launches:
+                try_launch(launch, [window], cmd, out=out)
+            d = new
+            print(
+                f"Added {len(added)} windows, removed {len(removed)}, changed {len(changed)} "
+                f"and launched {len(launches)} commands "
+                f"in {(time.monotonic() - start) * 1000:.0f} ms",
+                file=out,
+            )
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+        if layout:
+            # don't leave our marks to windows filling the placeholders later
+            with Connection(socket_path) as connection:
+                marks = all_marks(d)
+                present = {mark for con in iter_cons(connection.get_tree()) for mark in con.get("marks") or []}
+                if marks & present:
+                    report_failures(connection.command(unmark_command(sorted(marks & present))))
@@ -0,0 +1,21 @@
+from pyi3l.tree import Window, Tabbed
+from pyi3l.linux import xfce4_terminal
+from pyi3l.check import find_overlaps
+
+def test_distinct_titles_dont_overlap():
+    d = {1: Tabbed([Window(xfce4_terminal("A")), Window(xfce4_terminal("B"))])}
+    assert find_overlaps(d) == []
+
+def test_same_titles_overlap():
+    d = {1: Tabbed([Window(xfce4_terminal("A"))]), 2: Tabbed([Window(xfce4_terminal("A"))])}
+    [(a, b)] = find_overlaps(d)
+    assert {a.ws, b.ws} == {1, 2}
+
+def test_default_title_overlaps_each_window_once():
+    d = {1: Tabbed([
+        Window(xfce4_terminal()),
+        Window(xfce4_terminal("Terminal - A")),
+        Window(xfce4_terminal("Terminal - B")),
+    ])}
+    pairs = {frozenset([a.window_index, b.window_index]) for a, b in find_overlaps(d)}
+    assert pairs == {frozenset([0, 1]), frozenset([0, 2])}
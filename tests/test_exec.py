@@ -0,0 +1,57 @@
+from dataclasses import replace
+
+import pytest
+
+from pyi3l.tree import Window, Tabbed, SystemCommand
+from pyi3l.linux import xfce4_terminal
+from pyi3l.i3sim import I3Simulator
+from pyi3l.exec import run, spawn
+
+# End-to-end runs of exec.run against the simulator, with fake launches
+
+@pytest.fixture
+def sim(tmp_path):
+    sim = I3Simulator(str(tmp_path / "i3.sock")).start_in_thread()
+    yield sim
+    sim.stop_thread()
+
+def layout():
+    return {1: Tabbed([Window(xfce4_terminal("A")), Window(xfce4_terminal("B"))])}
+
+def marks(sim):
+    return sim.call(lambda: [mark for con in sim.cons() for mark in con.marks])
+
+def test_placeholders_swallowed(sim):
+    run(layout(), socket_path=sim.socket_path, launch=sim.fake_launch(0.01), placeholder_timeout=5)
+    assert sim.call(sim.placeholders) == []
+    assert sorted(con.name for con in sim.call(sim.windows)) == ["A", "B"]
+    assert marks(sim) == []
+
+def test_stale_placeholder_kept(sim):
+    run(layout(), socket_path=sim.socket_path, launch=lambda windows, cmd: None, placeholder_timeout=0.1)
+    assert len(sim.call(sim.placeholders)) == 2
+    assert marks(sim) == []
+
+def test_stale_placeholder_removed(sim):
+    run(
+        layout(),
+        socket_path=sim.socket_path,
+        launch=lambda windows, cmd: None,
+        placeholder_timeout=0.1,
+        remove_stale=True,
+    )
+    assert sim.call(sim.placeholders) == []
+
+def test_failing_launch(sim):
+    missing = SystemCommand(["pyi3l-no-such-app"])
+    d = {1: Tabbed([
+        Window(replace(xfce4_terminal("A"), commands=[missing])),
+        Window(xfce4_terminal("B")),
+    ])}
+    fake = sim.fake_launch(0.01)
+    def launch(windows, cmd):
+        (spawn if cmd == missing else fake)(windows, cmd)
+    run(d, socket_path=sim.socket_path, launch=launch, placeholder_timeout=0.5)
+    assert [con.name for con in sim.call(sim.windows)] == ["B"]
+    assert len(sim.call(sim.placeholders)) == 1
+    assert marks(sim) == []
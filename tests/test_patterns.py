@@ -0,0 +1,23 @@
+import pytest
+
+from pyi3l.patterns import Pattern, Literal, Anything, AnyOf, CompoundPattern
+
+@pytest.mark.parametrize("pattern", [
+    Literal("Terminal"),
+    Literal("a.b (c) [d] $x^ *+?|"),
+    CompoundPattern([Literal("Terminal - "), Anything()]),
+    AnyOf([Literal("a.b"), Literal("c(d)")]),
+    CompoundPattern([AnyOf([Literal("x"), CompoundPattern([Literal("y"), Anything()])]), Literal("z")]),
+])
+def test_import_round_trip(pattern):
+    imported = Pattern.import_pattern(f"^{pattern.to_pcre()}$")
+    assert imported == pattern
+    assert imported.to_pcre() == pattern.to_pcre()
+
+def test_import_none():
+    assert Pattern.import_pattern(None) is None
+
+@pytest.mark.parametrize("s", ["Terminal", "^a|b$", "^(a$", "^a)$", "^a+$", "^\\d$"])
+def test_import_unsupported(s):
+    with pytest.raises(ValueError):
+        Pattern.import_pattern(s)
@@ -0,0 +1,59 @@
+from pyi3l.pressure import Throttle, PsiSource
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+class FakeSource:
+    # Returns the given memory pressures one by one, repeating the last one
+    def __init__(self, *values):
+        self.values = list(values)
+
+    def read(self):
+        return {"memory": self.values.pop(0) if len(self.values) > 1 else self.values[0]}
+
+def throttle(*values, **kwargs):
+    clock = FakeClock()
+    return Throttle({"memory": 10}, source=FakeSource(*values), sleep=clock.sleep, clock=clock, **kwargs), clock
+
+def test_no_pressure_doesnt_wait():
+    t, clock = throttle(0)
+    assert [t.wait() for _ in range(30)] == [0] * 30
+    assert clock.now == 0
+
+def test_waits_while_exceeded():
+    t, clock = throttle(20, 20, 5, interval=0.25)
+    assert t.wait() == 0.5
+
+def test_max_wait():
+    t, clock = throttle(20, max_wait=1, interval=0.25)
+    assert t.wait() == 1
+
+def test_settles_near_threshold():
+    t, clock = throttle(8, 3, 3, settle=0.1)
+    t.wait()
+    assert t.wait() == 0.1
+    assert t.wait() == 0
+
+def test_psi_source(tmp_path):
+    def write(total, avg10):
+        (tmp_path / "memory").write_text(
+            f"some avg10={avg10:.2f} avg60=0.00 avg300=0.00 total={total}\n"
+            f"full avg10=0.00 avg60=0.00 avg300=0.00 total=0\n"
+        )
+    clock = FakeClock()
+    source = PsiSource(str(tmp_path), clock=clock, window=1.0)
+    write(0, 1.5)
+    assert source.read() == {"memory": 1.5}
+    clock.now = 0.5
+    write(100000, 1.5)
+    assert source.read() == {"memory": 1.5}     # too short to tell, kernel's average
+    clock.now = 2.0
+    write(400000, 1.5)
+    assert source.read() == {"memory": 20.0}    # 0.3 s stalled since the newest sample at least 1 s old
@@ -0,0 +1,30 @@
+import pytest
+
+from pyi3l.tree import Window, Swallow, optimize_swallows
+from pyi3l.patterns import Literal, AnyOf
+from pyi3l.linux import xfce4_terminal
+
+def test_optimize_swallows_drops_duplicates():
+    swallow = Swallow(win_class=Literal("X"), title=Literal("a"))
+    assert optimize_swallows([swallow, swallow]) == [swallow]
+
+def test_optimize_swallows_drops_covered():
+    broad = Swallow(win_class=Literal("X"))
+    narrow = Swallow(win_class=Literal("X"), title=Literal("a"))
+    assert optimize_swallows([narrow, broad]) == [broad]
+    assert optimize_swallows([broad, narrow]) == [broad]
+
+def test_optimize_swallows_merges_single_difference():
+    a = Swallow(win_class=Literal("X"), title=Literal("a"))
+    b = Swallow(win_class=Literal("X"), title=Literal("b"))
+    assert optimize_swallows([a, b]) == [Swallow(win_class=Literal("X"), title=AnyOf([Literal("a"), Literal("b")]))]
+
+def test_optimize_swallows_keeps_different():
+    a = Swallow(win_class=Literal("X"), title=Literal("a"))
+    b = Swallow(win_class=Literal("Y"), title=Literal("b"))
+    assert optimize_swallows([a, b]) == [a, b]
+
+def test_window_placement():
+    assert Window(xfce4_terminal("A"), placement="rule").placement == "rule"
+    with pytest.raises(ValueError):
+        Window(xfce4_terminal("A"), placement="rules")